@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+#  -*- coding:utf-8 -*-
+##############################################################################
+# PURPOSE:   Benchmark of the in-process comparison engine on synthetic data
+# COPYRIGHT: (C) 2015 by the GRASS Development Team
+#
+# This program is free software under the GNU General Public
+# License (>=v2). Read the file COPYING that comes with GRASS
+# for details.
+##############################################################################
+"""
+Time the stages of the comparison procedure on synthetic road networks
+
+The benchmark needs NumPy only (no GRASS session): REF networks are made by
+osmcomp.synth at growing sizes, the OSM networks are derived from them and
+the in-process equivalents of the three modules are timed:
+
+    getstat     length of REF/OSM inside the buffers (v.osm.precomp GetStat)
+    angle       angular comparison (v.osm.preproc angle loop, -i engine)
+    tol_eval    length of OSM within the tol_eval values per box (v.osm.acc CalcTol)
+    tol         TOL of every box (v.osm.acc -d)
+
+For every stage the best time of the runs, the features per second and the
+peak memory are reported. Example:
+
+    python bench.py --layouts grid,planar --sizes 10,20,40 --json bench.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+from osmcomp import distance, engine, synth
+from osmcomp.segments import Segments
+
+
+def GetStat(ref, osm, buffers, step):
+    ## Length of REF within the buffers around OSM and vice versa
+    distance.LengthCurve(ref, osm, buffers, step)
+    distance.LengthCurve(osm, ref, buffers, step)
+
+
+def AngleLoop(ref, osm, bf, angle_thres):
+    (idx, t0, t1) = engine.MatchSegments(ref, osm, bf, angle_thres)
+    engine.MergeIntervals(idx, t0, t1)
+
+
+def Boxes(ref, osm, box):
+    ## OSM segments of every box (by midpoint) and REF segments of the box enlarged by 10%
+    tiles = engine.Tiles(osm, box)
+    rxmin, rymin, rxmax, rymax = ref.Bounds()
+    oxmin, oymin, oxmax, oymax = osm.Bounds()
+    for sel in tiles:
+        ext = 0.1 * box
+        keep = ((rxmax >= oxmin[sel].min() - ext) & (rxmin <= oxmax[sel].max() + ext) &
+                (rymax >= oymin[sel].min() - ext) & (rymin <= oymax[sel].max() + ext))
+        yield ref.Take(keep), osm.Take(sel)
+
+
+def TolEval(ref, osm, box, tol_eval, step):
+    for (ref_box, osm_box) in Boxes(ref, osm, box):
+        (x, y, l_osm, owner) = distance.Densify(osm_box, step)
+        distance.LengthWithin(distance.NearestDistance(x, y, ref_box, max(tol_eval)), l_osm, tol_eval)
+
+
+def Tol(ref, osm, box, perc, tol_max, acc):
+    for (ref_box, osm_box) in Boxes(ref, osm, box):
+        distance.CoverDistance(osm_box, ref_box, [perc / 100.0], tol_max, acc)
+
+
+def Measure(func, repeat):
+    ## Best wall time of repeat runs, then peak memory (MB) of a traced run
+    best = float("inf")
+    for i in range(repeat):
+        t = time.time()
+        func()
+        best = min(best, time.time() - t)
+    peak = float("nan")
+    if tracemalloc is not None:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1] / 2.0**20
+        tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the comparison engine on synthetic networks")
+    parser.add_argument("--layouts", default="grid,radial,planar", help="REF layouts, separated by comma (%s)" % ",".join(sorted(synth.LAYOUTS)))
+    parser.add_argument("--sizes", default="10,20,40", help="Network sizes (blocks per side or rings), separated by comma")
+    parser.add_argument("--spacing", type=float, default=100.0, help="Block size (map units)")
+    parser.add_argument("--vertices", type=int, default=4, help="Vertices of every REF road")
+    parser.add_argument("--noise", type=float, default=2.0, help="Standard deviation of the OSM positional noise (map units)")
+    parser.add_argument("--missing", type=float, default=0.1, help="Fraction of REF roads missing in OSM")
+    parser.add_argument("--extra", type=float, default=0.1, help="Fraction of OSM roads not in REF")
+    parser.add_argument("--resegment", type=float, default=0.5, help="Fraction of OSM roads with a different segmentation")
+    parser.add_argument("--buffers", default="1,2,5,10,20", help="Buffer widths of the getstat stage (map units)")
+    parser.add_argument("--angle", type=float, default=30.0, help="Angle threshold of the angle stage (degrees)")
+    parser.add_argument("--box", type=float, default=500.0, help="Grid box size of the tol stages (map units)")
+    parser.add_argument("--tol_eval", default="1,2,5,10", help="Threshold values of the tol_eval stage (map units)")
+    parser.add_argument("--tol_max", type=float, default=20.0, help="Upper bound of the tol stage (map units)")
+    parser.add_argument("--perc", type=float, default=95.0, help="OSM length percentage of the tol stage (%%)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of every stage (the best one is reported)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator")
+    parser.add_argument("--json", help="Name for the JSON file with the results")
+    args = parser.parse_args()
+
+    buffers = [float(b) for b in args.buffers.split(",")]
+    tol_eval = [float(t) for t in args.tol_eval.split(",")]
+    step = min(buffers) / 10.0
+    acc = args.tol_max / 1000.0
+
+    results = []
+    print("%-8s %6s %-9s %10s %10s %12s %9s" % ("layout", "size", "stage", "features", "time (s)", "features/s", "peak (MB)"))
+    for layout in args.layouts.split(","):
+        for size in [int(s) for s in args.sizes.split(",")]:
+            lines = synth.LAYOUTS[layout](size, spacing=args.spacing, vertices=args.vertices)
+            ref = Segments.FromLines(*lines)
+            osm = Segments.FromLines(*synth.DeriveOSM(lines, noise=args.noise, missing=args.missing, extra=args.extra,
+                                                      resegment=args.resegment, seed=args.seed))
+            boxes = len(engine.Tiles(osm, args.box))
+            stages = [("getstat", len(ref) + len(osm), lambda: GetStat(ref, osm, buffers, step)),
+                      ("angle", len(ref), lambda: AngleLoop(ref, osm, buffers[-1], args.angle)),
+                      ("tol_eval", boxes, lambda: TolEval(ref, osm, args.box, tol_eval, step)),
+                      ("tol", boxes, lambda: Tol(ref, osm, args.box, args.perc, args.tol_max, acc))]
+            for (stage, features, func) in stages:
+                (wall, peak) = Measure(func, args.repeat)
+                rate = features / wall if wall > 0 else float("inf")
+                print("%-8s %6d %-9s %10d %10.3f %12.1f %9.1f" % (layout, size, stage, features, wall, rate, peak))
+                results.append({"layout": layout, "size": size, "stage": stage, "features": features,
+                                "wall": wall, "features_per_second": rate, "peak_mb": peak,
+                                "ref_segments": len(ref), "osm_segments": len(osm)})
+
+    if args.json:
+        fil = open(args.json, "w")
+        json.dump({"arguments": vars(args), "results": results}, fil, indent=2, sort_keys=True)
+        fil.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
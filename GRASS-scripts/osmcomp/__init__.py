@@ -0,0 +1,20 @@
+"""
+Shared library of the v.osm.* modules
+
+The modules in this package work on in-memory copies of the road networks
+(NumPy arrays of two-vertex segments) so that the comparison steps can be
+answered with array operations instead of one GRASS command per feature.
+Only vectio talks to GRASS; all the others can be used without a GRASS
+session.
+"""
+
+
+def Require(grass):
+    """Stop the calling module with grass.fatal if NumPy is missing
+
+    To be called before importing the modules of the package.
+    """
+    try:
+        import numpy
+    except ImportError:
+        grass.fatal("The v.osm modules require NumPy (http://www.numpy.org/)")
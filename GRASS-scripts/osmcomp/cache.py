@@ -0,0 +1,121 @@
+"""
+Persistent content-addressed cache shared by the v.osm.* modules
+
+Entries are files named after the SHA-1 of a key built from the content
+hash of the input maps (vectio.ContentHash), the operation and its
+parameters, so they stay valid across runs and modules and never need to be
+invalidated: a changed map simply gets new keys. Values are stored as JSON,
+maps as v.pack archives (vectio.CachedMap). Reading an entry refreshes its
+modification time, and Evict() removes the least recently used entries once
+the cache exceeds its size limit. Files are written under a temporary name
+and renamed, so concurrent processes can share the same folder.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+
+class Cache(object):
+    """Cache in the folder path, limited to limit MB; does nothing when no path is given"""
+
+    def __init__(self, path=None, limit=1024):
+        self.path = path
+        self.enabled = bool(path)
+        self.limit = float(limit) * 2**20
+        if self.enabled and not os.path.isdir(path):
+            os.makedirs(path)
+
+    @staticmethod
+    def Key(*parts):
+        """Return the key of an entry from JSON-serializable parts"""
+        text = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def Path(self, key, ext=".json"):
+        """Return the file of an entry (two-character subfolders keep folders small)"""
+        return os.path.join(self.path, key[:2], key + ext)
+
+    def Hit(self, key, ext=".json"):
+        """Tell if an entry exists, marking it as recently used"""
+        path = self.Path(key, ext)
+        try:
+            os.utime(path, None)
+        except OSError:
+            return False
+        return True
+
+    def Store(self, key, ext, func):
+        """Create an entry: func(name) must write the file name"""
+        path = self.Path(key, ext)
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                # created meanwhile by another process
+                pass
+        fd, tmp = tempfile.mkstemp(suffix=ext, dir=folder)
+        os.close(fd)
+        try:
+            func(tmp)
+            os.rename(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return path
+
+    def Get(self, key):
+        """Return the value of an entry, or None if missing"""
+        if not self.enabled or not self.Hit(key):
+            return None
+        try:
+            fil = open(self.Path(key))
+            try:
+                return json.load(fil)
+            finally:
+                fil.close()
+        except (IOError, OSError, ValueError):
+            # evicted meanwhile, or a truncated file
+            return None
+
+    def Put(self, key, value):
+        if not self.enabled:
+            return
+
+        def Write(name):
+            fil = open(name, "w")
+            json.dump(value, fil)
+            fil.close()
+        self.Store(key, ".json", Write)
+
+    def Value(self, key, func):
+        """Return the value of an entry, computing and storing it with func() if missing"""
+        value = self.Get(key)
+        if value is None:
+            value = func()
+            self.Put(key, value)
+        return value
+
+    def Evict(self):
+        """Remove the least recently used entries until the cache fits its size limit"""
+        if not self.enabled:
+            return
+        entries = []
+        for folder, dirs, files in os.walk(self.path):
+            for name in files:
+                path = os.path.join(folder, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(e[1] for e in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,82 @@
+"""
+Checkpoints of long-running loops
+
+The state of a loop is a JSON-serializable dict saved to a file, plus
+optional named sets of NumPy arrays saved next to it (<file>.<name>.npz).
+Every file is written under a temporary name and renamed, so a process
+killed while saving leaves the previous checkpoint intact. Arrays are
+saved before the state, which therefore never refers to missing data.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+
+def _Replace(path, write):
+    """Write a file through write(fileobject) and a rename"""
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    fil = open(tmp, "wb")
+    try:
+        write(fil)
+    finally:
+        fil.close()
+    os.rename(tmp, path)
+
+
+class Checkpoint(object):
+    """State saved to the file path at most every interval seconds; does nothing without a path"""
+
+    def __init__(self, path=None, interval=60.0):
+        self.path = path
+        self.enabled = bool(path)
+        self.interval = interval
+        self.last = time.time()
+
+    def _Arrays(self, name):
+        return "%s.%s.npz" % (self.path, name)
+
+    def Load(self):
+        """Return the saved state, or None if there is none"""
+        if not self.enabled or not os.path.exists(self.path):
+            return None
+        fil = open(self.path)
+        try:
+            return json.load(fil)
+        finally:
+            fil.close()
+
+    def LoadArrays(self, name):
+        """Return the dict of arrays saved as name"""
+        data = np.load(self._Arrays(name))
+        try:
+            return dict((key, data[key]) for key in data.files)
+        finally:
+            data.close()
+
+    def Due(self):
+        """Tell if the interval since the last save has passed"""
+        return self.enabled and time.time() - self.last >= self.interval
+
+    def Save(self, state, name=None, **arrays):
+        """Save the state and, if name is given, the arrays"""
+        if not self.enabled:
+            return
+        if name is not None:
+            _Replace(self._Arrays(name), lambda fil: np.savez(fil, **arrays))
+        text = json.dumps(state, sort_keys=True).encode("utf-8")
+        _Replace(self.path, lambda fil: fil.write(text))
+        self.last = time.time()
+
+    def Remove(self):
+        """Delete the state and all the saved arrays"""
+        if not self.enabled:
+            return
+        folder = os.path.dirname(os.path.abspath(self.path))
+        prefix = os.path.basename(self.path) + "."
+        for name in os.listdir(folder):
+            if name.startswith(prefix) and name.endswith(".npz"):
+                os.remove(os.path.join(folder, name))
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,179 @@
+"""
+Distance of a line network from another one
+
+Lines are cut into short pieces and the distance of every piece from the
+other network is computed once; the length lying within any buffer width
+is then read from the cumulative distribution of those distances.
+"""
+import numpy as np
+
+from .geom import PointSegmentDistance
+from .index import GridIndex
+
+
+def Densify(seg, step):
+    """Cut segments into pieces not longer than step
+
+    Return (x, y, length, owner): the midpoint and length of every piece and
+    the index of the segment it comes from.
+    """
+    L = seg.Length()
+    n = np.maximum(np.ceil(L / step), 1).astype(np.int64)
+    owner = np.repeat(np.arange(len(seg)), n)
+    k = np.arange(owner.shape[0]) - np.repeat(np.cumsum(n) - n, n)
+    t = (k + 0.5) / n[owner]
+    x = seg.x0[owner] + t * (seg.x1[owner] - seg.x0[owner])
+    y = seg.y0[owner] + t * (seg.y1[owner] - seg.y0[owner])
+    return x, y, (L / n)[owner], owner
+
+
+def _Index(seg, maxdist):
+    """Return the grid index searched by NearestDistance()"""
+    return GridIndex(*seg.Bounds(), cell=max(maxdist / 8.0, float(np.median(seg.Length()))))
+
+
+def NearestDistance(px, py, seg, maxdist, chunk=100000, index=None):
+    """Return the distance of every point from the nearest segment
+
+    Segments are searched within a growing radius, so that only the points
+    far from the network pay for large search windows. Distances larger
+    than maxdist are returned as infinity. index is the one built by an
+    earlier call with the same seg and maxdist (see LengthCurve).
+    """
+    dist = np.full(px.shape[0], np.inf)
+    if len(seg) == 0 or px.shape[0] == 0:
+        return dist
+    radius = maxdist / 8.0
+    if index is None:
+        index = _Index(seg, maxdist)
+    todo = np.arange(px.shape[0])
+    while todo.shape[0] > 0:
+        for s in range(0, todo.shape[0], chunk):
+            pts = todo[s:s + chunk]
+            qi, si = index.Query(px[pts] - radius, py[pts] - radius, px[pts] + radius, py[pts] + radius)
+            d = PointSegmentDistance(px[pts][qi], py[pts][qi], seg.x0[si], seg.y0[si], seg.x1[si], seg.y1[si])
+            np.minimum.at(dist, pts[qi], d)
+        # a nearest segment within the search radius is the true nearest one
+        if radius >= maxdist:
+            break
+        todo = todo[dist[todo] > radius]
+        radius = min(2 * radius, maxdist)
+    dist[dist > maxdist] = np.inf
+    return dist
+
+
+def LengthWithin(dist, lengths, values):
+    """Return the total length of the pieces not farther than every value"""
+    order = np.argsort(dist)
+    cum = np.concatenate(([0.0], np.cumsum(lengths[order])))
+    return cum[np.searchsorted(dist[order], values, "right")]
+
+
+def LengthCurve(seg, other, values, step, chunk=1000000):
+    """Return the length of seg lying within every distance of values from other
+
+    This is LengthWithin() of the pieces of seg (see Densify) and their
+    distance from other, computed on about chunk pieces at a time: memory
+    does not grow with the number of pieces, however small step is.
+    """
+    values = np.atleast_1d(np.asarray(values, dtype=float))
+    within = np.zeros(values.shape[0])
+    if len(seg) == 0 or len(other) == 0:
+        return within
+    maxdist = values.max()
+    index = _Index(other, maxdist)
+    cum = np.cumsum(np.maximum(np.ceil(seg.Length() / step), 1))
+    s = 0
+    while s < len(seg):
+        # a segment longer than chunk pieces makes a chunk on its own
+        e = max(int(np.searchsorted(cum, (cum[s - 1] if s > 0 else 0) + chunk, "right")), s + 1)
+        (x, y, lengths, owner) = Densify(seg.Take(slice(s, e)), step)
+        within += LengthWithin(NearestDistance(x, y, other, maxdist, index=index), lengths, values)
+        s = e
+    return within
+
+
+def _Quantile(values, lengths, target):
+    """Return the smallest value v such that the length of the pieces <= v reaches target"""
+    order = np.argsort(values)
+    cum = np.cumsum(lengths[order])
+    i = np.searchsorted(cum, target * (1 - 1e-12), "left")
+    return values[order][i] if i < cum.shape[0] else np.inf
+
+
+def LengthQuantile(dist, lengths, fraction):
+    """Return the smallest distance within which the given fraction of the total length lies"""
+    if dist.shape[0] == 0:
+        return np.inf
+    return _Quantile(dist, lengths, fraction * lengths.sum())
+
+
+def Percentages(perc):
+    """Return the distinct percentages of perc and their TOL_<perc> column names
+
+    Percentages equal as numbers (95 and 95.0) are kept once, as floats;
+    names use the shortest form of the number (TOL_95, TOL_97_5).
+    """
+    values = []
+    for p in perc:
+        p = float(p)
+        if p not in values:
+            values.append(p)
+    names = [("TOL_%s" % ("%d" % p if p == int(p) else repr(p))).replace(".", "_") for p in values]
+    return values, names
+
+
+def CoverDistance(seg, other, fractions, maxdist, acc, step=None):
+    """Return the distances from other within which the given fractions of seg lie
+
+    This is the smallest buffer width around other covering each fraction
+    of the length of seg. The distance along a piece changes by at most half
+    its length, so every quantile lies in a bracket computed from the piece
+    distances; the pieces overlapping a bracket wider than acc are halved
+    until all the brackets are narrower than acc. The upper end of each
+    bracket is returned (NaN when it is beyond maxdist).
+    """
+    fractions = np.atleast_1d(np.asarray(fractions, dtype=float))
+    result = np.full(fractions.shape[0], np.nan)
+    L = seg.Length()
+    total = L.sum()
+    if len(seg) == 0 or len(other) == 0 or total == 0:
+        return result
+    if step is None:
+        step = max(maxdist / 16.0, acc)
+    n = np.maximum(np.ceil(L / step), 1).astype(np.int64)
+    owner = np.repeat(np.arange(len(seg)), n)
+    k = np.arange(owner.shape[0]) - np.repeat(np.cumsum(n) - n, n)
+    a = k / n[owner].astype(float)
+    b = (k + 1) / n[owner].astype(float)
+    dist = np.zeros(0)
+    new = np.arange(owner.shape[0])
+    while True:
+        # distance of the new pieces' midpoints
+        t = (a[new] + b[new]) / 2.0
+        o = owner[new]
+        mx = seg.x0[o] + t * (seg.x1[o] - seg.x0[o])
+        my = seg.y0[o] + t * (seg.y1[o] - seg.y0[o])
+        half = L[o] * (b[new] - a[new]) / 2.0
+        d = NearestDistance(mx, my, other, maxdist + (half.max() if half.shape[0] else 0))
+        dist = np.concatenate((dist, d))
+        half = L[owner] * (b - a) / 2.0
+        lengths = 2 * half
+        split = np.zeros(owner.shape[0], dtype=bool)
+        for i, f in enumerate(fractions):
+            lo = _Quantile(dist - half, lengths, f * total)
+            hi = _Quantile(dist + half, lengths, f * total)
+            result[i] = hi if hi <= maxdist else np.nan
+            if lo <= maxdist and hi - lo > acc:
+                split |= (dist + half >= lo) & (dist - half <= min(hi, maxdist))
+        split &= lengths > acc / 2.0
+        if not split.any():
+            return result
+        # replace every split piece with its two halves
+        mid = (a[split] + b[split]) / 2.0
+        keep = ~split
+        new = np.arange(keep.sum(), keep.sum() + 2 * mid.shape[0])
+        owner = np.concatenate((owner[keep], owner[split], owner[split]))
+        a, b = (np.concatenate((a[keep], a[split], mid)),
+                np.concatenate((b[keep], mid, b[split])))
+        dist = dist[keep]
@@ -0,0 +1,166 @@
+"""
+In-process engine for the angular comparison of v.osm.preproc
+
+For every REF segment the OSM segments falling inside its buffer are found
+through a grid index instead of v.buffer/v.overlay, then the candidate
+pairs are filtered by angle and clipped to the buffer in bulk.
+"""
+import multiprocessing
+
+import numpy as np
+
+from .geom import AngleDiff, ClipToBuffer
+from .index import GridIndex
+
+
+def MatchSegments(ref, osm, bf, angle_thres, flat=None, chunk=50000):
+    """Return the OSM pieces matching the REF segments
+
+    ref and osm are Segments; bf is the buffer width and angle_thres the
+    maximum angle (degrees) between matching segments; flat is a boolean
+    array telling which REF segments get a buffer without caps. Return
+    (osm index, t0, t1) of every accepted piece.
+    """
+    if flat is None:
+        flat = np.zeros(len(ref), dtype=bool)
+    oxmin, oymin, oxmax, oymax = osm.Bounds()
+    lengths = osm.Length()
+    cell = max(bf, float(np.median(lengths))) if len(osm) else bf
+    index = GridIndex(oxmin, oymin, oxmax, oymax, cell)
+    az_ref = ref.Azimuth()
+    az_osm = osm.Azimuth()
+    rxmin, rymin, rxmax, rymax = ref.Bounds()
+    found = ([], [], [])
+    for s in range(0, len(ref), chunk):
+        e = min(s + chunk, len(ref))
+        ri, oi = index.Query(rxmin[s:e] - bf, rymin[s:e] - bf, rxmax[s:e] + bf, rymax[s:e] + bf)
+        ri += s
+        keep = AngleDiff(az_ref[ri], az_osm[oi]) <= angle_thres
+        for f, a in zip(found, ClipPairs(ref, osm, ri[keep], oi[keep], bf, flat)):
+            f.append(a)
+    if not found[0]:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+    return tuple(np.concatenate(f) for f in found)
+
+
+def ClipPairs(ref, osm, ri, oi, bf, flat=None):
+    """Clip the OSM segments oi to the buffers of the REF segments ri
+
+    Return (osm index, t0, t1) of the pairs whose clipped piece has non-zero
+    length (see MatchSegments).
+    """
+    if flat is None:
+        flat = np.zeros(len(ref), dtype=bool)
+    t0, t1, ok = ClipToBuffer(osm.x0[oi], osm.y0[oi], osm.x1[oi], osm.y1[oi],
+                              ref.x0[ri], ref.y0[ri], ref.x1[ri], ref.y1[ri], bf, flat[ri])
+    return oi[ok], t0[ok], t1[ok]
+
+
+def CoveredLength(seg, other, d, group=None, other_group=None, chunk=50000):
+    """Return the length of every segment of seg lying within distance d of other
+
+    This is the length inside the buffer (round caps) around other, as
+    given by v.buffer and v.overlay. When group and other_group are given,
+    a segment is only compared with the segments of other in its group.
+    """
+    covered = np.zeros(len(seg))
+    if len(seg) == 0 or len(other) == 0:
+        return covered
+    index = GridIndex(*other.Bounds(), cell=max(d, float(np.median(other.Length()))))
+    xmin, ymin, xmax, ymax = seg.Bounds()
+    lengths = seg.Length()
+    for s in range(0, len(seg), chunk):
+        e = min(s + chunk, len(seg))
+        si, oi = index.Query(xmin[s:e] - d, ymin[s:e] - d, xmax[s:e] + d, ymax[s:e] + d)
+        si += s
+        if group is not None:
+            keep = group[si] == other_group[oi]
+            si = si[keep]
+            oi = oi[keep]
+        t0, t1, ok = ClipToBuffer(seg.x0[si], seg.y0[si], seg.x1[si], seg.y1[si],
+                                  other.x0[oi], other.y0[oi], other.x1[oi], other.y1[oi], d)
+        # a segment is entirely in one chunk, so merging per chunk is enough
+        idx, t0, t1 = MergeIntervals(si[ok], t0[ok], t1[ok])
+        covered += np.bincount(idx, (t1 - t0) * lengths[idx], len(seg))
+    return covered
+
+
+def MergeIntervals(idx, t0, t1):
+    """Merge overlapping intervals t0-t1 belonging to the same segment idx"""
+    if idx.shape[0] == 0:
+        return idx, t0, t1
+    order = np.lexsort((t0, idx))
+    idx = idx[order]
+    t0 = t0[order]
+    t1 = t1[order]
+    # parameters are in [0, 1]: shifting by 2*idx keeps the running maximum per segment
+    reach = np.maximum.accumulate(t1 + 2.0 * idx) - 2.0 * idx
+    new = np.ones(idx.shape[0], dtype=bool)
+    new[1:] = (idx[1:] != idx[:-1]) | (t0[1:] > reach[:-1])
+    start = np.nonzero(new)[0]
+    end = np.append(start[1:], idx.shape[0]) - 1
+    return idx[start], t0[start], reach[end]
+
+
+def Tiles(seg, size):
+    """Group segments by the square tile (of the given size) containing their midpoint
+
+    Return the list of index arrays of the non-empty tiles, row by row.
+    """
+    mx = (seg.x0 + seg.x1) / 2.0
+    my = (seg.y0 + seg.y1) / 2.0
+    col = np.floor((mx - mx.min()) / size).astype(np.int64)
+    row = np.floor((my - my.min()) / size).astype(np.int64)
+    key = row * (col.max() + 1) + col
+    order = np.argsort(key, kind="mergesort")
+    cut = np.nonzero(np.diff(key[order]))[0] + 1
+    return np.split(order, cut)
+
+
+def _MatchTile(task):
+    (tile, oi, ref, osm, bf, angle_thres, flat) = task
+    idx, t0, t1 = MatchSegments(ref, osm, bf, angle_thres, flat)
+    return tile, oi[idx], t0, t1
+
+
+def MatchTiled(ref, osm, bf, angle_thres, size, flat=None, start=0, nprocs=1):
+    """Run MatchSegments tile by tile
+
+    Every REF segment belongs to the tile of its midpoint and is compared
+    with the OSM segments falling in the extent of the tile's REF segments
+    plus a halo equal to the buffer, so each tile yields exactly the pieces
+    an untiled run finds for its REF segments. Pieces from neighbouring
+    tiles may overlap: merge them with MergeIntervals. Yield (tile number,
+    osm index, t0, t1) for every tile, in order, from the tile number start
+    on (e.g. to resume an interrupted run). With nprocs > 1 the tiles are
+    matched by a pool of processes. ref and osm stay whole in memory: tiles
+    are the unit of checkpoints and parallel work, not a memory bound.
+    """
+    if flat is None:
+        flat = np.zeros(len(ref), dtype=bool)
+    if len(ref) == 0:
+        return
+    oxmin, oymin, oxmax, oymax = osm.Bounds()
+    index = GridIndex(oxmin, oymin, oxmax, oymax, size)
+    rxmin, rymin, rxmax, rymax = ref.Bounds()
+
+    def Tasks():
+        for tile, sel in enumerate(Tiles(ref, size)):
+            if tile < start:
+                continue
+            qi, oi = index.Query([rxmin[sel].min() - bf], [rymin[sel].min() - bf],
+                                 [rxmax[sel].max() + bf], [rymax[sel].max() + bf])
+            yield tile, oi, ref.Take(sel), osm.Take(oi), bf, angle_thres, flat[sel]
+
+    if nprocs <= 1:
+        for task in Tasks():
+            yield _MatchTile(task)
+        return
+    pool = multiprocessing.Pool(nprocs)
+    try:
+        for found in pool.imap(_MatchTile, Tasks()):
+            yield found
+    finally:
+        # also when the caller stops early: the remaining tiles are dropped
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,39 @@
+"""
+Fingerprints of the line data falling in a set of boxes
+
+A box fingerprint is the SHA-1 of the segments whose bounding box meets
+the box, taken in a canonical order and orientation: it does not depend on
+feature order, categories or digitizing direction, and it changes whenever
+a segment inside the box is added, removed or moved.
+"""
+import hashlib
+
+import numpy as np
+
+from .index import GridIndex
+
+
+def Canonical(seg):
+    """Return the Nx4 array of segment end points, the smaller end point first"""
+    swap = (seg.x1 < seg.x0) | ((seg.x1 == seg.x0) & (seg.y1 < seg.y0))
+    return np.column_stack((np.where(swap, seg.x1, seg.x0), np.where(swap, seg.y1, seg.y0),
+                            np.where(swap, seg.x0, seg.x1), np.where(swap, seg.y0, seg.y1)))
+
+
+def BoxHashes(seg, xmin, ymin, xmax, ymax):
+    """Return the hex fingerprint of the segments meeting every box"""
+    xmin = np.asarray(xmin, dtype=float)
+    coords = Canonical(seg)
+    rank = np.empty(len(seg), dtype=np.int64)
+    rank[np.lexsort(coords.T[::-1])] = np.arange(len(seg))
+    index = GridIndex(*seg.Bounds())
+    bi, si = index.Query(xmin, ymin, xmax, ymax)
+    order = np.lexsort((rank[si], bi))
+    bi = bi[order]
+    si = si[order]
+    cut = np.searchsorted(bi, np.arange(xmin.shape[0] + 1))
+    result = []
+    for b in range(xmin.shape[0]):
+        sel = si[cut[b]:cut[b + 1]]
+        result.append(hashlib.sha1(np.ascontiguousarray(coords[sel]).tobytes()).hexdigest())
+    return result
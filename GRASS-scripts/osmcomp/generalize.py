@@ -0,0 +1,78 @@
+"""
+Douglas-Peucker generalization of lines held as arrays
+
+The recursion of the algorithm is run breadth-first on all the lines at
+once: every pass takes all the open vertex ranges, finds the vertex of
+each farthest from the segment joining its ends and splits the ranges
+where that distance is beyond the threshold. The result is the one of
+v.generalize method=douglas, in a number of passes growing with the depth
+of the recursion instead of one call per range.
+"""
+import multiprocessing
+
+import numpy as np
+
+from .geom import PointSegmentDistance
+
+
+def Simplify(offsets, xy, thres):
+    """Return the mask of the vertices kept by the Douglas-Peucker algorithm
+
+    offsets and xy are the lines as returned by vectio.ReadLines(); the end
+    points of every line are always kept.
+    """
+    n = xy.shape[0]
+    keep = np.zeros(n, dtype=bool)
+    nvert = np.diff(np.append(offsets, n))
+    s = offsets[nvert > 0]
+    e = s + nvert[nvert > 0] - 1
+    keep[s] = True
+    keep[e] = True
+    while True:
+        open_ = e - s > 1
+        s = s[open_]
+        e = e[open_]
+        if s.shape[0] == 0:
+            return keep
+        cnt = e - s - 1
+        start = np.cumsum(cnt) - cnt
+        owner = np.repeat(np.arange(s.shape[0]), cnt)
+        v = s[owner] + 1 + (np.arange(owner.shape[0]) - start[owner])
+        d = PointSegmentDistance(xy[v, 0], xy[v, 1], xy[s[owner], 0], xy[s[owner], 1],
+                                 xy[e[owner], 0], xy[e[owner], 1])
+        dmax = np.maximum.reduceat(d, start)
+        # first farthest vertex of every range (as v.generalize)
+        far = np.flatnonzero(d == dmax[owner])
+        far = far[np.unique(owner[far], return_index=True)[1]]
+        split = dmax > thres
+        m = v[far][split]
+        keep[m] = True
+        s, e = np.concatenate((s[split], m)), np.concatenate((m, e[split]))
+
+
+def _SimplifyChunk(args):
+    return Simplify(*args)
+
+
+def Generalize(cats, offsets, xy, thres, nprocs=1):
+    """Return the lines (cats, offsets, xy) generalized with threshold thres
+
+    With nprocs > 1 the lines are split into chunks of about the same number
+    of vertices, simplified by a pool of processes.
+    """
+    n = xy.shape[0]
+    if nprocs > 1 and offsets.shape[0] > 1:
+        bounds = np.unique(np.concatenate(([0], np.searchsorted(offsets, np.linspace(0, n, nprocs + 1)[1:-1]),
+                                           [offsets.shape[0]])))
+        ends = np.append(offsets, n)
+        chunks = [(offsets[a:b] - ends[a], xy[ends[a]:ends[b]], thres) for a, b in zip(bounds[:-1], bounds[1:])]
+        pool = multiprocessing.Pool(min(nprocs, len(chunks)))
+        try:
+            keep = np.concatenate(pool.map(_SimplifyChunk, chunks))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        keep = Simplify(offsets, xy, thres)
+    cum = np.concatenate(([0], np.cumsum(keep)))
+    return cats, cum[offsets], xy[keep]
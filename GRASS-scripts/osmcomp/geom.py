@@ -0,0 +1,123 @@
+"""
+Vectorized geometry on two-vertex segments
+
+All functions work element-wise on coordinate arrays, so that a whole set
+of segment pairs is processed by a single call.
+"""
+import numpy as np
+
+## Minimum length (as a fraction of the segment) of a clipped piece
+EPS = 1e-9
+
+
+def Azimuth(x0, y0, x1, y1):
+    """Return the direction of the segments as an angle in [0, pi)"""
+    return np.mod(np.arctan2(y1 - y0, x1 - x0), np.pi)
+
+
+def AngleDiff(az_a, az_b):
+    """Return the acute angle (degrees) between two sets of directions"""
+    d = np.mod(np.abs(az_a - az_b), np.pi)
+    return np.degrees(np.minimum(d, np.pi - d))
+
+
+def _ClipRect(ts, te, as_, an, ds, dn, L, d):
+    """Clip the parameter range [ts, te] to the rectangle 0<=s<=L, |n|<=d"""
+    ts = ts.copy()
+    te = te.copy()
+    empty = np.zeros(ts.shape, dtype=bool)
+    # each constraint has the form p*t <= q
+    for p, q in ((-ds, as_), (ds, L - as_), (-dn, an + d), (dn, d - an)):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = q / p
+        neg = p < 0
+        pos = p > 0
+        ts = np.where(neg, np.maximum(ts, r), ts)
+        te = np.where(pos, np.minimum(te, r), te)
+        empty |= (p == 0) & (q < 0)
+    empty |= te < ts
+    return ts, te, empty
+
+
+def _ClipDisc(ax, ay, wx, wy, cx, cy, d):
+    """Return the parameter range of P(t) = A + t*W inside the disc (c, d)"""
+    a = wx * wx + wy * wy
+    fx = ax - cx
+    fy = ay - cy
+    b = 2.0 * (wx * fx + wy * fy)
+    c = fx * fx + fy * fy - d * d
+    disc = b * b - 4.0 * a * c
+    empty = (disc < 0) | (a == 0)
+    sq = np.sqrt(np.where(empty, 0.0, disc))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ts = (-b - sq) / (2.0 * a)
+        te = (-b + sq) / (2.0 * a)
+    ts = np.maximum(ts, 0.0)
+    te = np.minimum(te, 1.0)
+    empty |= te < ts
+    return ts, te, empty
+
+
+def ClipToBuffer(ax, ay, bx, by, cx, cy, dx, dy, d, flat=None):
+    """Clip segments A-B to the buffer of width d around segments C-D
+
+    The buffer is the set of points closer than d to C-D (round caps), or
+    the rectangle of half-width d along C-D when flat is True (no caps, as
+    v.buffer -c). Return the parameters (t0, t1) of the part of A-B inside
+    the buffer and a boolean array telling which pairs have a clipped piece
+    of non-zero length.
+    """
+    ax, ay, bx, by, cx, cy, dx, dy = [np.asarray(v, dtype=float)
+                                      for v in (ax, ay, bx, by, cx, cy, dx, dy)]
+    n = ax.shape[0]
+    if flat is None:
+        flat = np.zeros(n, dtype=bool)
+    L = np.hypot(dx - cx, dy - cy)
+    safe = np.where(L > 0, L, 1.0)
+    ux = (dx - cx) / safe
+    uy = (dy - cy) / safe
+    # A and B in the local frame of C-D
+    as_ = (ax - cx) * ux + (ay - cy) * uy
+    an = -(ax - cx) * uy + (ay - cy) * ux
+    bs = (bx - cx) * ux + (by - cy) * uy
+    bn = -(bx - cx) * uy + (by - cy) * ux
+    t0, t1, empty = _ClipRect(np.zeros(n), np.ones(n), as_, an, bs - as_, bn - an, L, d)
+    empty |= L == 0
+    t0 = np.where(empty, 2.0, t0)
+    t1 = np.where(empty, -1.0, t1)
+    # round caps: the buffer is convex, so the union of rectangle and discs is an interval
+    wx = bx - ax
+    wy = by - ay
+    for qx, qy in ((cx, cy), (dx, dy)):
+        s, e, emp = _ClipDisc(ax, ay, wx, wy, qx, qy, d)
+        emp |= flat
+        t0 = np.where(emp, t0, np.minimum(t0, s))
+        t1 = np.where(emp, t1, np.maximum(t1, e))
+    ok = (t1 - t0) > EPS
+    return t0, t1, ok
+
+
+def ClipToRect(ax, ay, bx, by, xmin, ymin, xmax, ymax):
+    """Clip segments A-B to the rectangles xmin,ymin - xmax,ymax
+
+    Return the parameters (t0, t1) of the part of A-B inside the rectangle
+    and a boolean array telling which pieces have non-zero length.
+    """
+    ax, ay, bx, by = [np.asarray(v, dtype=float) for v in (ax, ay, bx, by)]
+    n = ax.shape[0]
+    half = (np.asarray(ymax, dtype=float) - ymin) / 2.0
+    t0, t1, empty = _ClipRect(np.zeros(n), np.ones(n), ax - xmin, ay - (ymin + half),
+                              bx - ax, by - ay, np.asarray(xmax, dtype=float) - xmin, half)
+    ok = ~empty & ((t1 - t0) > EPS)
+    return t0, t1, ok
+
+
+def PointSegmentDistance(px, py, x0, y0, x1, y1):
+    """Return the distance of points (px, py) from segments x0,y0 - x1,y1"""
+    wx = x1 - x0
+    wy = y1 - y0
+    l2 = wx * wx + wy * wy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = ((px - x0) * wx + (py - y0) * wy) / l2
+    t = np.clip(np.where(l2 > 0, t, 0.0), 0.0, 1.0)
+    return np.hypot(px - x0 - t * wx, py - y0 - t * wy)
@@ -0,0 +1,132 @@
+"""
+Clipping of segment networks to grid boxes
+
+v.osm.acc needs the part of OSM and REF inside every box of its grid. On a
+regular grid the box of a point is found by index arithmetic, so the lines
+are cut where they cross the grid lines and every piece is assigned to the
+box containing its midpoint: the pieces of all the boxes come out of a few
+array operations instead of one v.extract/v.overlay per box. Grids of any
+polygons are clipped through an STR-tree of the polygons with shapely
+(>= 2.0, only needed for them).
+"""
+import numpy as np
+
+from .geom import EPS, ClipToRect
+from .index import GridIndex
+from .segments import Segments
+
+
+def _Crossings(c0, c1):
+    """Return (owner, t) of the integer values strictly between c0 and c1"""
+    lo = np.floor(np.minimum(c0, c1)) + 1
+    hi = np.ceil(np.maximum(c0, c1)) - 1
+    n = np.maximum(hi - lo + 1, 0).astype(np.int64)
+    owner = np.repeat(np.arange(c0.shape[0]), n)
+    k = lo[owner] + (np.arange(owner.shape[0]) - np.repeat(np.cumsum(n) - n, n))
+    return owner, (k - c0[owner]) / (c1 - c0)[owner]
+
+
+def ClipToGrid(seg, west, north, ewres, nsres, rows, cols):
+    """Cut segments at the lines of a regular grid
+
+    The grid has its upper left corner at west,north and rows x cols boxes
+    of ewres x nsres. Return the box of every piece, numbered row by row
+    from the upper left one (row * cols + col), and the pieces as Segments;
+    the parts outside the grid are dropped.
+    """
+    cx0 = (seg.x0 - west) / ewres
+    cx1 = (seg.x1 - west) / ewres
+    cy0 = (north - seg.y0) / nsres
+    cy1 = (north - seg.y1) / nsres
+    ox, tx = _Crossings(cx0, cx1)
+    oy, ty = _Crossings(cy0, cy1)
+    n = len(seg)
+    owner = np.concatenate((np.arange(n), np.arange(n), ox, oy))
+    t = np.concatenate((np.zeros(n), np.ones(n), tx, ty))
+    order = np.lexsort((t, owner))
+    owner = owner[order]
+    t = t[order]
+    # consecutive cut points of the same segment bound a piece
+    keep = (owner[1:] == owner[:-1]) & (t[1:] - t[:-1] > EPS)
+    idx = owner[:-1][keep]
+    t0 = t[:-1][keep]
+    t1 = t[1:][keep]
+    tm = (t0 + t1) / 2.0
+    col = np.floor(cx0[idx] + tm * (cx1 - cx0)[idx]).astype(np.int64)
+    row = np.floor(cy0[idx] + tm * (cy1 - cy0)[idx]).astype(np.int64)
+    inside = (col >= 0) & (col < cols) & (row >= 0) & (row < rows)
+    return (row * cols + col)[inside], seg.Pieces(idx[inside], t0[inside], t1[inside])
+
+
+def ClipToBoxes(seg, xmin, ymin, xmax, ymax):
+    """Return the box of every piece and the parts of the segments inside every box
+
+    Boxes may overlap, so a segment can give a piece to several of them.
+    """
+    index = GridIndex(xmin, ymin, xmax, ymax)
+    si, bi = index.Query(*seg.Bounds())
+    t0, t1, ok = ClipToRect(seg.x0[si], seg.y0[si], seg.x1[si], seg.y1[si],
+                            index.xmin[bi], index.ymin[bi], index.xmax[bi], index.ymax[bi])
+    return bi[ok], seg.Pieces(si[ok], t0[ok], t1[ok])
+
+
+def _Shapely():
+    try:
+        import shapely
+    except ImportError:
+        shapely = None
+    if shapely is None or not hasattr(shapely, "STRtree") or not hasattr(shapely, "prepare"):
+        raise ImportError("clipping to polygons requires shapely >= 2.0")
+    return shapely
+
+
+def ClipToPolygons(seg, polygons, chunk=100000):
+    """Return the polygon of every piece and the parts of the segments inside every polygon
+
+    polygons are WKT strings. The candidate pairs come from an STR-tree of
+    the (prepared) polygons; segments lying inside their polygon are taken
+    whole and only the others are intersected, a chunk of segments at once.
+    """
+    shapely = _Shapely()
+    polys = shapely.from_wkt(np.asarray(polygons, dtype=object))
+    shapely.prepare(polys)
+    tree = shapely.STRtree(polys)
+    lines = shapely.linestrings(np.stack((seg.x0, seg.y0, seg.x1, seg.y1), axis=1).reshape(-1, 2, 2))
+    found = ([], [], [], [], [], [])
+    for s in range(0, len(seg), chunk):
+        si, pi = tree.query(lines[s:s + chunk], predicate="intersects")
+        si += s
+        inside = shapely.contains_properly(polys[pi], lines[si])
+        for f, a in zip(found, (pi[inside], si[inside], seg.x0[si[inside]], seg.y0[si[inside]],
+                                seg.x1[si[inside]], seg.y1[si[inside]])):
+            f.append(a)
+        si = si[~inside]
+        pi = pi[~inside]
+        parts, pair = shapely.get_parts(shapely.intersection(lines[si], polys[pi]), return_index=True)
+        keep = shapely.get_type_id(parts) == 1
+        parts = parts[keep]
+        pair = pair[keep]
+        # consecutive vertices of a clipped line are the pieces
+        xy, part = shapely.get_coordinates(parts, return_index=True)
+        same = part[1:] == part[:-1]
+        owner = pair[part[:-1][same]]
+        for f, a in zip(found, (pi[owner], si[owner], xy[:-1][same, 0], xy[:-1][same, 1],
+                                xy[1:][same, 0], xy[1:][same, 1])):
+            f.append(a)
+    if not found[0]:
+        return np.zeros(0, dtype=np.int64), seg.Take(np.zeros(0, dtype=np.int64))
+    poly, idx, x0, y0, x1, y1 = [np.concatenate(f) for f in found]
+    pieces = Segments(x0, y0, x1, y1, seg.cat[idx], None if seg.fid is None else seg.fid[idx])
+    keep = pieces.Length() > EPS
+    return poly[keep], pieces.Take(keep)
+
+
+def BoxLength(box, pieces, nbox):
+    """Return the length of the pieces in every box"""
+    return np.bincount(box, pieces.Length(), nbox)
+
+
+def ByBox(box, nbox):
+    """Return (order, cut): the pieces of box b are order[cut[b]:cut[b + 1]]"""
+    order = np.argsort(box, kind="mergesort")
+    return order, np.searchsorted(box[order], np.arange(nbox + 1))
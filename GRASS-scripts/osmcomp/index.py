@@ -0,0 +1,96 @@
+"""
+Uniform grid spatial index over bounding boxes
+"""
+import numpy as np
+
+
+def _Expand(ix0, iy0, ix1, iy1, nx):
+    """Return (owner, key) for every grid cell covered by the cell ranges"""
+    nxs = ix1 - ix0 + 1
+    nys = iy1 - iy0 + 1
+    count = nxs * nys
+    total = int(count.sum())
+    owner = np.repeat(np.arange(ix0.shape[0]), count)
+    start = np.repeat(np.cumsum(count) - count, count)
+    local = np.arange(total) - start
+    w = nxs[owner]
+    keys = (iy0[owner] + local // w) * nx + ix0[owner] + local % w
+    return owner, keys
+
+
+class GridIndex(object):
+    """Index bounding boxes by the cells of a regular grid
+
+    Every box is registered in all the cells it overlaps. Query() joins a
+    whole set of query boxes against the index at once and returns the
+    candidate pairs whose boxes intersect.
+    """
+
+    def __init__(self, xmin, ymin, xmax, ymax, cell=None):
+        self.xmin = np.asarray(xmin, dtype=float)
+        self.ymin = np.asarray(ymin, dtype=float)
+        self.xmax = np.asarray(xmax, dtype=float)
+        self.ymax = np.asarray(ymax, dtype=float)
+        self.size = self.xmin.shape[0]
+        if self.size == 0:
+            self.x0 = self.y0 = 0.0
+            self.cell = 1.0
+            self.nx = self.ny = 1
+            self.keys = np.zeros(0, dtype=np.int64)
+            self.ids = np.zeros(0, dtype=np.int64)
+            return
+        if cell is None or cell <= 0:
+            ext = np.maximum(self.xmax - self.xmin, self.ymax - self.ymin)
+            cell = float(np.median(ext))
+        self.x0 = float(self.xmin.min())
+        self.y0 = float(self.ymin.min())
+        width = max(float(self.xmax.max()) - self.x0, float(self.ymax.max()) - self.y0)
+        # avoid degenerate cells and grids too large to be addressed
+        self.cell = max(float(cell), width / 2.0**20, 1e-9)
+        self.nx = int((float(self.xmax.max()) - self.x0) // self.cell) + 1
+        self.ny = int((float(self.ymax.max()) - self.y0) // self.cell) + 1
+        ix0, iy0, ix1, iy1 = self._Cells(self.xmin, self.ymin, self.xmax, self.ymax)
+        owner, keys = _Expand(ix0, iy0, ix1, iy1, self.nx)
+        order = np.argsort(keys, kind="mergesort")
+        self.keys = keys[order]
+        self.ids = owner[order]
+
+    def _Cells(self, xmin, ymin, xmax, ymax):
+        ix0 = np.clip(((xmin - self.x0) // self.cell).astype(np.int64), 0, self.nx - 1)
+        iy0 = np.clip(((ymin - self.y0) // self.cell).astype(np.int64), 0, self.ny - 1)
+        ix1 = np.clip(((xmax - self.x0) // self.cell).astype(np.int64), 0, self.nx - 1)
+        iy1 = np.clip(((ymax - self.y0) // self.cell).astype(np.int64), 0, self.ny - 1)
+        return ix0, iy0, ix1, iy1
+
+    def Query(self, xmin, ymin, xmax, ymax):
+        """Return (query id, indexed id) of all the intersecting box pairs"""
+        xmin = np.asarray(xmin, dtype=float)
+        ymin = np.asarray(ymin, dtype=float)
+        xmax = np.asarray(xmax, dtype=float)
+        ymax = np.asarray(ymax, dtype=float)
+        none = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        if self.size == 0 or xmin.shape[0] == 0:
+            return none
+        qids = np.nonzero((xmax >= self.x0) & (ymax >= self.y0) &
+                          (xmin <= self.xmax.max()) & (ymin <= self.ymax.max()))[0]
+        if qids.shape[0] == 0:
+            return none
+        ix0, iy0, ix1, iy1 = self._Cells(xmin[qids], ymin[qids], xmax[qids], ymax[qids])
+        owner, keys = _Expand(ix0, iy0, ix1, iy1, self.nx)
+        lo = np.searchsorted(self.keys, keys, "left")
+        hi = np.searchsorted(self.keys, keys, "right")
+        count = hi - lo
+        qi = np.repeat(qids[owner], count)
+        pos = np.arange(int(count.sum())) - np.repeat(np.cumsum(count) - count, count) + np.repeat(lo, count)
+        if pos.shape[0] == 0:
+            # all the cells covered by the queries are empty
+            return none
+        ei = self.ids[pos]
+        # a pair is found once for every shared cell
+        pair = np.sort(qi * self.size + ei)
+        pair = pair[np.concatenate(([True], pair[1:] != pair[:-1]))]
+        qi = pair // self.size
+        ei = pair % self.size
+        hit = ((self.xmin[ei] <= xmax[qi]) & (self.xmax[ei] >= xmin[qi]) &
+               (self.ymin[ei] <= ymax[qi]) & (self.ymax[ei] >= ymin[qi]))
+        return qi[hit], ei[hit]
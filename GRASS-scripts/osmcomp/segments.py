@@ -0,0 +1,112 @@
+"""
+Two-vertex segments of a line network held as coordinate arrays
+"""
+import numpy as np
+
+from .geom import Azimuth
+
+## Arrays describing a set of segments
+FIELDS = ("x0", "y0", "x1", "y1", "cat")
+
+
+def _Optional(a, dtype):
+    return None if a is None else np.asarray(a, dtype=dtype)
+
+
+class Segments(object):
+    """Segments x0,y0 - x1,y1 with the category of the feature they belong to
+
+    fid is the index of the source line in the map (see FromLines); length
+    and azimuth may be given when already known (e.g. by a segment store)
+    and are otherwise computed on request.
+    """
+
+    def __init__(self, x0, y0, x1, y1, cat, fid=None, length=None, azimuth=None):
+        self.x0 = np.asarray(x0, dtype=float)
+        self.y0 = np.asarray(y0, dtype=float)
+        self.x1 = np.asarray(x1, dtype=float)
+        self.y1 = np.asarray(y1, dtype=float)
+        self.cat = np.asarray(cat, dtype=np.int64)
+        self.fid = _Optional(fid, np.int64)
+        self.length = _Optional(length, float)
+        self.azimuth = _Optional(azimuth, float)
+        # sort order by category, built by the first Find()
+        self._order = None
+        self._sorted = None
+
+    @classmethod
+    def FromLines(cls, cats, offsets, xy):
+        """Split every line into its consecutive vertex pairs (as v.split vertices=2)
+
+        cats, offsets and xy are the output of vectio.ReadLines(); segments
+        of zero length are dropped.
+        """
+        nvert = np.diff(np.append(offsets, xy.shape[0]))
+        last = np.zeros(xy.shape[0], dtype=bool)
+        last[offsets[nvert > 0] + nvert[nvert > 0] - 1] = True
+        start = np.nonzero(~last)[0]
+        feat = np.repeat(np.arange(offsets.shape[0]), np.maximum(nvert - 1, 0))
+        seg = cls(xy[start, 0], xy[start, 1], xy[start + 1, 0], xy[start + 1, 1], cats[feat], fid=feat)
+        return seg.Take(seg.Length() > 0)
+
+    @classmethod
+    def FromArrays(cls, arrays, prefix=""):
+        """Rebuild segments from the arrays returned by Arrays()"""
+        return cls(*[arrays[prefix + f] for f in FIELDS], fid=arrays.get(prefix + "fid"))
+
+    def Arrays(self, prefix=""):
+        """Return the segment arrays by name (e.g. to be saved with numpy.savez)"""
+        arrays = dict((prefix + f, getattr(self, f)) for f in FIELDS)
+        if self.fid is not None:
+            arrays[prefix + "fid"] = self.fid
+        return arrays
+
+    def __len__(self):
+        return self.x0.shape[0]
+
+    def Take(self, sel):
+        """Return the subset of segments selected by an index or a mask"""
+        return Segments(self.x0[sel], self.y0[sel], self.x1[sel], self.y1[sel], self.cat[sel],
+                        *[None if a is None else a[sel] for a in (self.fid, self.length, self.azimuth)])
+
+    def Find(self, cats):
+        """Return the index of the segments with the given categories
+
+        Raise KeyError if a category is missing.
+        """
+        if self._order is None:
+            self._order = np.argsort(self.cat, kind="mergesort")
+            self._sorted = self.cat[self._order]
+        cats = np.asarray(cats, dtype=np.int64)
+        if cats.size == 0:
+            return np.zeros(cats.shape, dtype=np.int64)
+        if len(self) == 0:
+            raise KeyError("category %d not found" % cats.flat[0])
+        pos = np.minimum(np.searchsorted(self._sorted, cats), len(self) - 1)
+        missing = self._sorted[pos] != cats
+        if missing.any():
+            raise KeyError("category %d not found" % cats[missing].flat[0])
+        return self._order[pos]
+
+    def Length(self):
+        if self.length is not None:
+            return self.length
+        return np.hypot(self.x1 - self.x0, self.y1 - self.y0)
+
+    def Azimuth(self):
+        if self.azimuth is not None:
+            return self.azimuth
+        return Azimuth(self.x0, self.y0, self.x1, self.y1)
+
+    def Bounds(self):
+        """Return xmin, ymin, xmax, ymax of every segment"""
+        return (np.minimum(self.x0, self.x1), np.minimum(self.y0, self.y1),
+                np.maximum(self.x0, self.x1), np.maximum(self.y0, self.y1))
+
+    def Pieces(self, idx, t0, t1):
+        """Return the parts t0-t1 (as parameters along the segment) of segments idx"""
+        dx = self.x1[idx] - self.x0[idx]
+        dy = self.y1[idx] - self.y0[idx]
+        return Segments(self.x0[idx] + t0 * dx, self.y0[idx] + t0 * dy,
+                        self.x0[idx] + t1 * dx, self.y0[idx] + t1 * dy, self.cat[idx],
+                        None if self.fid is None else self.fid[idx])
@@ -0,0 +1,264 @@
+"""
+Long-lived comparison server
+
+Networks are loaded once and kept in memory with the distance of their
+pieces (see distance.Densify) from the other network, so that precomp
+statistics and per-box accuracy values are read from arrays instead of
+being recomputed by GRASS commands. Requests are JSON objects POSTed over
+HTTP:
+
+    {"op": "precomp", "osm": ..., "ref": ..., "buffers": [...]}
+    {"op": "acc", "osm": ..., "ref": ..., "boxes": [[w, s, e, n], ...],
+     "tol_eval": [...]}  or  {..., "perc": ..., "tol_max": ...}
+    {"op": "status"}
+
+where perc is a number (giving TOL) or a list (giving TOL_<perc> for
+every value).
+
+They are queued and processed one at a time by a single worker thread, so
+that the cached arrays and the GRASS session are never used concurrently.
+Cached entries are dropped, least recently used first, beyond a memory
+limit.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+import numpy as np
+
+from . import distance
+from .index import GridIndex
+
+
+class LRU(object):
+    """Values by key; the least recently used are dropped beyond limit bytes"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.items = OrderedDict()
+        self.size = 0
+
+    def Get(self, key):
+        if key not in self.items:
+            return None
+        value, size = self.items.pop(key)
+        self.items[key] = (value, size)
+        return value
+
+    def Put(self, key, value, size):
+        if key in self.items:
+            self.size -= self.items.pop(key)[1]
+        self.items[key] = (value, size)
+        self.size += size
+        while self.size > self.limit and len(self.items) > 1:
+            self.size -= self.items.popitem(last=False)[1][1]
+
+
+def _Size(*arrays):
+    return sum(a.nbytes for a in arrays)
+
+
+class Comparison(object):
+    """Answer comparison requests from networks and distances kept in memory
+
+    stamp(name) must return a value changing with the map, and load(name)
+    its Segments; step is the length of the pieces and maxdist the largest
+    distance (buffer, tolerance) that can be requested.
+    """
+
+    def __init__(self, stamp, load, step, maxdist, limit):
+        self.stamp = stamp
+        self.load = load
+        self.step = step
+        self.maxdist = maxdist
+        self.cache = LRU(limit)
+
+    def Network(self, name):
+        key = ("network", name, self.stamp(name))
+        seg = self.cache.Get(key)
+        if seg is None:
+            seg = self.load(name)
+            self.cache.Put(key, seg, _Size(seg.x0, seg.y0, seg.x1, seg.y1, seg.cat))
+        return seg
+
+    def Pieces(self, name, other):
+        """Return (x, y, length, dist) of the pieces of name and their distance from other"""
+        key = ("pieces", name, self.stamp(name), other, self.stamp(other))
+        found = self.cache.Get(key)
+        if found is None:
+            seg = self.Network(name)
+            (x, y, lengths, owner) = distance.Densify(seg, self.step)
+            dist = distance.NearestDistance(x, y, self.Network(other), self.maxdist)
+            found = (x, y, lengths, dist)
+            self.cache.Put(key, found, _Size(*found))
+        return found
+
+    def _Check(self, values, name):
+        if len(values) == 0:
+            raise ValueError("no %s given" % name)
+        if max(values) > self.maxdist:
+            raise ValueError("%s larger than the server maxdist (%s)" % (name, self.maxdist))
+
+    def Precomp(self, req):
+        """Length of REF and OSM inside and outside the buffers (as v.osm.precomp)"""
+        buffers = [float(b) for b in req["buffers"]]
+        self._Check(buffers, "buffers")
+        (x, y, l_ref, d_ref) = self.Pieces(req["ref"], req["osm"])
+        (x, y, l_osm, d_osm) = self.Pieces(req["osm"], req["ref"])
+        ref_in = distance.LengthWithin(d_ref, l_ref, buffers)
+        osm_in = distance.LengthWithin(d_osm, l_osm, buffers)
+        return {"buffers": buffers,
+                "ref_in": ref_in.tolist(), "ref_out": (l_ref.sum() - ref_in).tolist(),
+                "osm_in": osm_in.tolist(), "osm_out": (l_osm.sum() - osm_in).tolist()}
+
+    def Acc(self, req):
+        """OSM length and t_/p_ values or TOL of every box (as v.osm.acc)
+
+        The pieces of OSM are assigned to the box containing their midpoint
+        and their distance is taken from the whole REF network.
+        """
+        boxes = np.asarray(req["boxes"], dtype=float).reshape(-1, 4)
+        (x, y, lengths, dist) = self.Pieces(req["osm"], req["ref"])
+        index = GridIndex(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3])
+        (pi, bi) = index.Query(x, y, x, y)
+        # a piece on the border of two boxes goes to the first one
+        first = np.ones(pi.shape[0], dtype=bool)
+        order = np.lexsort((bi, pi))
+        pi = pi[order]
+        bi = bi[order]
+        first[1:] = pi[1:] != pi[:-1]
+        pi = pi[first]
+        bi = bi[first]
+        nbox = boxes.shape[0]
+        l_osm = np.bincount(bi, lengths[pi], nbox)
+        result = [{"OSM": float(l)} for l in l_osm]
+        if "tol_eval" in req:
+            tol_eval = [float(t) for t in req["tol_eval"]]
+            self._Check(tol_eval, "tol_eval")
+            for (item, t) in zip(req["tol_eval"], tol_eval):
+                val = np.bincount(bi, lengths[pi] * (dist[pi] <= t), nbox)
+                for (res, v, l) in zip(result, val, l_osm):
+                    res["t_%s" % item] = float(v)
+                    res["p_%s" % item] = float(v * 100.0 / l) if l > 0 else None
+        else:
+            tol_max = float(req["tol_max"])
+            self._Check([tol_max], "tol_max")
+            perc = req.get("perc", 100.0)
+            if isinstance(perc, list):
+                perc, cols = distance.Percentages(perc)
+            else:
+                perc = [perc]
+                cols = ["TOL"]
+            fractions = [float(p) / 100.0 for p in perc]
+            order = np.argsort(bi, kind="mergesort")
+            cut = np.searchsorted(bi[order], np.arange(nbox + 1))
+            for (b, res) in enumerate(result):
+                sel = pi[order[cut[b]:cut[b + 1]]]
+                for (col, f) in zip(cols, fractions):
+                    x = distance.LengthQuantile(dist[sel], lengths[sel], f)
+                    res[col] = float(np.ceil(x * 100) / 100) if x <= tol_max else None
+        return {"boxes": result}
+
+    def Status(self, req):
+        names = sorted(set(key[1] for key in self.cache.items if key[0] == "network"))
+        return {"networks": names, "cache_mb": self.cache.size / 2.0**20,
+                "step": self.step, "maxdist": self.maxdist}
+
+    def Handle(self, req):
+        ops = {"precomp": self.Precomp, "acc": self.Acc, "status": self.Status}
+        if req.get("op") not in ops:
+            raise ValueError("unknown op <%s>" % req.get("op"))
+        return ops[req["op"]](req)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _Answer(comparison, req):
+    """Return the HTTP code and body answering req
+
+    A failing request must not end the worker thread: SystemExit (as raised
+    by grass.fatal) is reported as a failed request too.
+    """
+    try:
+        return 200, comparison.Handle(req)
+    except (KeyError, ValueError, TypeError) as e:
+        return 400, {"error": "bad request: %s" % e}
+    except SystemExit as e:
+        return 500, {"error": "request aborted (exit status %s)" % e.code}
+    except Exception as e:
+        return 500, {"error": str(e)}
+
+
+def Serve(comparison, host, port, queue_size=100, timeout=600.0, log=None):
+    """Serve requests until interrupted
+
+    Requests beyond queue_size waiting ones are refused (HTTP 503), and a
+    request not processed within timeout seconds gets HTTP 504.
+    """
+    jobs = queue.Queue(queue_size)
+
+    def Worker():
+        while True:
+            (req, result, done) = jobs.get()
+            result.append(_Answer(comparison, req))
+            done.set()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _Reply(self, code, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _Run(self, req):
+            result = []
+            done = threading.Event()
+            try:
+                jobs.put_nowait((req, result, done))
+            except queue.Full:
+                return self._Reply(503, {"error": "server busy"})
+            if not done.wait(timeout) and not result:
+                return self._Reply(504, {"error": "request timed out"})
+            self._Reply(*result[0])
+
+        def do_GET(self):
+            self._Run({"op": self.path.strip("/") or "status"})
+
+        def do_POST(self):
+            try:
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+            except ValueError:
+                return self._Reply(400, {"error": "invalid JSON"})
+            if not isinstance(req, dict):
+                return self._Reply(400, {"error": "the request must be a JSON object"})
+            if "op" not in req:
+                req["op"] = self.path.strip("/")
+            self._Run(req)
+
+        def log_message(self, format, *args):
+            if log is not None:
+                log(format % args)
+
+    worker = threading.Thread(target=Worker)
+    worker.daemon = True
+    worker.start()
+    server = _Server((host, port), Handler)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,51 @@
+"""
+Columnar segment store
+
+A segment store is a .npy file holding one record per two-vertex segment
+(end points, category, source feature, length and azimuth) as a NumPy
+structured array. It is opened memory-mapped, so loading it costs nothing
+until the data is touched, and the Segments built on it are views of the
+file columns.
+"""
+import os
+
+import numpy as np
+
+from .segments import Segments
+
+## Record of a segment: 64 bytes
+DTYPE = np.dtype([("x0", "f8"), ("y0", "f8"), ("x1", "f8"), ("y1", "f8"),
+                  ("cat", "i8"), ("fid", "i8"), ("length", "f8"), ("azimuth", "f8")])
+
+
+def Records(seg):
+    """Return the structured array of the segments"""
+    rec = np.empty(len(seg), dtype=DTYPE)
+    for f in ("x0", "y0", "x1", "y1", "cat"):
+        rec[f] = getattr(seg, f)
+    rec["fid"] = seg.fid if seg.fid is not None else -1
+    rec["length"] = seg.Length()
+    rec["azimuth"] = seg.Azimuth()
+    return rec
+
+
+def FromRecords(rec):
+    """Return the Segments viewing the columns of a structured array"""
+    return Segments(rec["x0"], rec["y0"], rec["x1"], rec["y1"], rec["cat"],
+                    fid=rec["fid"], length=rec["length"], azimuth=rec["azimuth"])
+
+
+def Save(path, seg):
+    """Write the segments to a store file (through a rename)"""
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    fil = open(tmp, "wb")
+    try:
+        np.save(fil, Records(seg))
+    finally:
+        fil.close()
+    os.rename(tmp, path)
+
+
+def Open(path):
+    """Return the Segments of a store file, memory-mapped read-only"""
+    return FromRecords(np.load(path, mmap_mode="r"))
@@ -0,0 +1,130 @@
+"""
+Synthetic REF and OSM road networks
+
+Networks are returned as (cats, offsets, xy), the layout of
+vectio.ReadLines(), so that Segments.FromLines() turns them into segments.
+A REF network is built as a regular grid, a radial layout or a random
+planar graph; DeriveOSM() makes an "OSM" version of it with positional
+noise, missing and extra roads and a different segmentation.
+"""
+import numpy as np
+
+
+def _Lines(paths):
+    """Pack a list of (n, 2) vertex arrays into (cats, offsets, xy)"""
+    if not paths:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros((0, 2))
+    nvert = np.array([p.shape[0] for p in paths], dtype=np.int64)
+    offsets = np.cumsum(nvert) - nvert
+    return np.arange(1, len(paths) + 1), offsets, np.concatenate(paths)
+
+
+def _Paths(lines):
+    """Unpack (cats, offsets, xy) into a list of vertex arrays"""
+    cats, offsets, xy = lines
+    return np.split(xy, offsets[1:])
+
+
+def _Edge(p0, p1, vertices):
+    """Return a straight line from p0 to p1 with the given number of vertices"""
+    t = np.linspace(0.0, 1.0, max(vertices, 2))[:, None]
+    return np.asarray(p0, dtype=float) * (1 - t) + np.asarray(p1, dtype=float) * t
+
+
+def GridNetwork(n, spacing=100.0, vertices=4):
+    """Regular grid of n x n blocks, one line per block side"""
+    paths = []
+    for i in range(n + 1):
+        for j in range(n):
+            paths.append(_Edge((j * spacing, i * spacing), ((j + 1) * spacing, i * spacing), vertices))
+            paths.append(_Edge((i * spacing, j * spacing), (i * spacing, (j + 1) * spacing), vertices))
+    return _Lines(paths)
+
+
+def RadialNetwork(n, spacing=100.0, vertices=4, spokes=None):
+    """n concentric rings crossed by radial roads, one line per ring arc and spoke piece"""
+    if spokes is None:
+        spokes = 4 * n
+    angle = np.linspace(0.0, 2 * np.pi, spokes + 1)
+    paths = []
+    for r in range(1, n + 1):
+        for k in range(spokes):
+            a = np.linspace(angle[k], angle[k + 1], max(vertices, 2))
+            paths.append(np.column_stack((r * spacing * np.cos(a), r * spacing * np.sin(a))))
+            p0 = (r - 1) * spacing * np.array([np.cos(angle[k]), np.sin(angle[k])])
+            p1 = r * spacing * np.array([np.cos(angle[k]), np.sin(angle[k])])
+            if r > 1 or k % 4 == 0:
+                # only a few spokes reach the centre
+                paths.append(_Edge(p0, p1, vertices))
+    return _Lines(paths)
+
+
+def PlanarNetwork(n, spacing=100.0, vertices=4, drop=0.2, seed=0):
+    """Random planar graph on n x n jittered blocks
+
+    Nodes of a regular grid are moved by up to a quarter of the spacing (so
+    that blocks stay simple quadrilaterals), every block gets one of its
+    diagonals and a fraction drop of the roads is removed.
+    """
+    rng = np.random.RandomState(seed)
+    node = np.mgrid[0:n + 1, 0:n + 1].transpose(1, 2, 0)[:, :, ::-1] * float(spacing)
+    node = node + rng.uniform(-0.25, 0.25, node.shape) * spacing
+    edges = []
+    for i in range(n + 1):
+        for j in range(n + 1):
+            if j < n:
+                edges.append((node[i, j], node[i, j + 1]))
+            if i < n:
+                edges.append((node[i, j], node[i + 1, j]))
+            if i < n and j < n:
+                if rng.rand() < 0.5:
+                    edges.append((node[i, j], node[i + 1, j + 1]))
+                else:
+                    edges.append((node[i, j + 1], node[i + 1, j]))
+    keep = rng.rand(len(edges)) >= drop
+    return _Lines([_Edge(p0, p1, vertices) for (p0, p1), k in zip(edges, keep) if k])
+
+
+def _Resample(path, count):
+    """Return count vertices evenly spaced along a path"""
+    step = np.hypot(*np.diff(path, axis=0).T)
+    along = np.concatenate(([0.0], np.cumsum(step)))
+    t = np.linspace(0.0, along[-1], count)
+    return np.column_stack((np.interp(t, along, path[:, 0]), np.interp(t, along, path[:, 1])))
+
+
+def DeriveOSM(lines, noise=1.0, missing=0.1, extra=0.1, resegment=0.5, seed=0):
+    """Return an "OSM" version of a REF network
+
+    Every vertex is moved by Gaussian noise of standard deviation noise
+    (map units); a fraction missing of the roads is dropped and a fraction
+    extra of new straight roads is added at random places; a fraction
+    resegment of the roads is resampled with a different number of
+    vertices and split into two features.
+    """
+    rng = np.random.RandomState(seed)
+    paths = [p for p in _Paths(lines) if rng.rand() >= missing]
+    out = []
+    for p in paths:
+        if p.shape[0] >= 2 and rng.rand() < resegment:
+            p = _Resample(p, rng.randint(3, 2 * p.shape[0] + 2))
+            cut = rng.randint(1, p.shape[0] - 1)
+            out.append(p[:cut + 1])
+            out.append(p[cut:])
+        else:
+            out.append(p.copy())
+    xy = lines[2]
+    if xy.shape[0] > 0 and paths:
+        xmin, ymin = xy.min(axis=0)
+        xmax, ymax = xy.max(axis=0)
+        size = np.median([np.hypot(*(p[-1] - p[0])) for p in paths])
+        for i in range(int(round(extra * len(paths)))):
+            p0 = rng.uniform((xmin, ymin), (xmax, ymax))
+            a = rng.uniform(0, 2 * np.pi)
+            out.append(_Edge(p0, p0 + size * np.array([np.cos(a), np.sin(a)]), 2 + rng.randint(3)))
+    out = [p + rng.normal(0.0, noise, p.shape) for p in out]
+    return _Lines(out)
+
+
+## Network layouts by name
+LAYOUTS = {"grid": GridNetwork, "radial": RadialNetwork, "planar": PlanarNetwork}
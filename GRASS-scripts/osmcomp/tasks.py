@@ -0,0 +1,84 @@
+"""
+Concurrent execution of independent steps
+
+A TaskGraph holds named steps (typically a few GRASS commands each) with
+the steps whose results they need. Run() starts every step as soon as its
+dependencies are done, at most workers at a time. GRASS commands run in
+their own processes, so worker threads are enough to overlap them; with a
+single worker the steps run one after another in the order they were
+added.
+"""
+import sys
+import threading
+
+
+class TaskGraph(object):
+    """Steps run concurrently by up to workers threads"""
+
+    def __init__(self, workers=1):
+        self.workers = max(int(workers), 1)
+        self.tasks = []
+        self.names = set()
+
+    def Add(self, name, func, deps=()):
+        """Add the step name computing func(*results of deps); deps must be added before"""
+        if name in self.names:
+            raise ValueError("task <%s> already added" % name)
+        for d in deps:
+            if d not in self.names:
+                raise ValueError("task <%s> depends on the unknown task <%s>" % (name, d))
+        self.tasks.append((name, func, tuple(deps)))
+        self.names.add(name)
+
+    def Run(self):
+        """Run all the steps and return their results by name
+
+        The first exception raised by a step (including SystemExit) is
+        raised again once the running steps are over; the steps not started
+        yet are skipped.
+        """
+        results = {}
+        if self.workers == 1:
+            for (name, func, deps) in self.tasks:
+                results[name] = func(*[results[d] for d in deps])
+            return results
+        pending = list(self.tasks)
+        running = set()
+        errors = []
+        cond = threading.Condition()
+
+        def Work(name, func, args):
+            value = None
+            try:
+                value = func(*args)
+            except BaseException:
+                # also SystemExit (grass.fatal) and KeyboardInterrupt
+                errors.append(sys.exc_info())
+            finally:
+                with cond:
+                    results[name] = value
+                    running.discard(name)
+                    cond.notify()
+
+        with cond:
+            while pending or running:
+                if not errors:
+                    for task in [t for t in pending if all(d in results for d in t[2])]:
+                        if len(running) >= self.workers:
+                            break
+                        (name, func, deps) = task
+                        pending.remove(task)
+                        running.add(name)
+                        thread = threading.Thread(target=Work, args=(name, func, [results[d] for d in deps]))
+                        thread.daemon = True
+                        thread.start()
+                if not running:
+                    break
+                # a timed wait can be interrupted (Ctrl-C) on Python 2 too
+                cond.wait(1.0)
+        if errors:
+            exc = errors[0]
+            if sys.version_info[0] >= 3:
+                raise exc[1].with_traceback(exc[2])
+            raise exc[1]
+        return results
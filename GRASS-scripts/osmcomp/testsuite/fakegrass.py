@@ -0,0 +1,63 @@
+"""
+Stand-in for grass.script in the tests of osmcomp.vectio
+
+Maps are folders holding a "coor" file with the v.out.ascii standard
+output of their lines, so that MapStamp(), ContentHash() and ReadLines()
+work as in a GRASS session.
+"""
+import os
+import sys
+import types
+
+import numpy as np
+
+try:
+    import grass.script
+except ImportError:
+    # vectio imports grass.script: give it an empty module to patch
+    sys.modules["grass"] = types.ModuleType("grass")
+    sys.modules["grass.script"] = types.ModuleType("grass.script")
+    sys.modules["grass"].script = sys.modules["grass.script"]
+
+
+class FakeGrass(object):
+    """The grass.script functions used by vectio, on maps in a folder"""
+
+    def __init__(self, gisdbase):
+        self.gisdbase = gisdbase
+        self.mapset = os.path.join(gisdbase, "loc", "PERMANENT")
+        self.calls = []
+
+    def gisenv(self):
+        return {"GISDBASE": self.gisdbase, "LOCATION_NAME": "loc", "MAPSET": "PERMANENT"}
+
+    def locn_is_latlong(self):
+        return False
+
+    def find_file(self, name, element):
+        folder = os.path.join(self.mapset, "vector", name)
+        if not os.path.isdir(folder):
+            return {"fullname": "", "file": ""}
+        return {"fullname": name + "@PERMANENT", "file": folder}
+
+    def read_command(self, module, **kwargs):
+        self.calls.append(module)
+        with open(os.path.join(self.mapset, "vector", kwargs["input"], "coor")) as fil:
+            return fil.read()
+
+    def WriteMap(self, name, lines):
+        """Create or replace the map name with the lines (cats, offsets, xy)"""
+        cats, offsets, xy = lines
+        ends = np.append(offsets, xy.shape[0])
+        text = "ORGANIZATION: test\nVERTI:\n" + "".join(
+            "L  %d 1\n%s 1 %d\n" % (e - o, "".join(" %.17g %.17g\n" % (x, y) for (x, y) in xy[o:e]), c)
+            for (c, o, e) in zip(cats, offsets, ends[1:]))
+        folder = os.path.join(self.mapset, "vector", name)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        path = os.path.join(folder, "coor")
+        # a new file, as GRASS writes it: the stamp changes even within the same second
+        if os.path.exists(path):
+            os.remove(path)
+        with open(path, "w") as fil:
+            fil.write(text)
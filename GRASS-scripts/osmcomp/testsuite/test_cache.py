@@ -0,0 +1,62 @@
+"""
+Tests of the persistent cache (osmcomp.cache)
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from osmcomp.cache import Cache
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_value(self):
+        cache = Cache(os.path.join(self.folder, "cache"))
+        calls = []
+
+        def Compute():
+            calls.append(1)
+            return [1.5, 2.5]
+        key = Cache.Key("v.overlay", "and", {"b": 1, "a": 2})
+        self.assertEqual(key, Cache.Key("v.overlay", "and", {"a": 2, "b": 1}))
+        self.assertNotEqual(key, Cache.Key("v.overlay", "not", {"a": 2, "b": 1}))
+        self.assertEqual(cache.Value(key, Compute), [1.5, 2.5])
+        # another run (or module) sharing the folder
+        self.assertEqual(Cache(cache.path).Value(key, Compute), [1.5, 2.5])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.Get(Cache.Key("other")), None)
+
+    def test_evict(self):
+        cache = Cache(os.path.join(self.folder, "cache"), limit=1000.0 / 2**20)
+        keys = [Cache.Key(i) for i in range(6)]
+        for (i, key) in enumerate(keys):
+            cache.Put(key, "x" * 300)
+            os.utime(cache.Path(key), (1000 + i, 1000 + i))
+        # reading an entry makes it recently used
+        self.assertEqual(cache.Get(keys[0]), "x" * 300)
+        cache.Evict()
+        kept = [i for (i, key) in enumerate(keys) if os.path.exists(cache.Path(key))]
+        sizes = sum(os.path.getsize(cache.Path(keys[i])) for i in kept)
+        self.assertEqual(kept, [0, 4, 5])
+        self.assertTrue(sizes <= 1000)
+
+    def test_disabled(self):
+        cache = Cache(None)
+        self.assertEqual(cache.Value(Cache.Key(1), lambda: 3), 3)
+        self.assertEqual(cache.Get(Cache.Key(1)), None)
+        cache.Evict()
+        self.assertEqual(os.listdir(self.folder), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""
+Tests of the loop checkpoints (osmcomp.checkpoint)
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from osmcomp import checkpoint
+from osmcomp.checkpoint import Checkpoint
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "run.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_resume(self):
+        ckpt = Checkpoint(self.path)
+        self.assertEqual(ckpt.Load(), None)
+        done = []
+        cat = np.arange(10)
+        for i in range(10):
+            done.append(i)
+            if i == 3 or i == 6:
+                ckpt.Save({"done": i + 1}, "pieces", cat=cat[:i + 1], t0=np.zeros(i + 1))
+        # a new process resumes from the last save
+        ckpt = Checkpoint(self.path)
+        self.assertEqual(ckpt.Load(), {"done": 7})
+        arrays = ckpt.LoadArrays("pieces")
+        np.testing.assert_array_equal(arrays["cat"], cat[:7])
+        self.assertEqual(sorted(arrays), ["cat", "t0"])
+        ckpt.Remove()
+        self.assertEqual(ckpt.Load(), None)
+        self.assertEqual(os.listdir(self.folder), [])
+
+    def test_interrupted_save(self):
+        ckpt = Checkpoint(self.path)
+        ckpt.Save({"done": 1}, "pieces", cat=np.arange(3))
+
+        def Fail(fil):
+            fil.write(b"{")
+            raise KeyboardInterrupt()
+        self.assertRaises(KeyboardInterrupt, checkpoint._Replace, self.path, Fail)
+        self.assertEqual(ckpt.Load(), {"done": 1})
+
+    def test_due(self):
+        ckpt = Checkpoint(self.path, interval=0.0)
+        self.assertTrue(ckpt.Due())
+        ckpt = Checkpoint(self.path, interval=3600.0)
+        self.assertFalse(ckpt.Due())
+        self.assertFalse(Checkpoint(None, interval=0.0).Due())
+
+    def test_disabled(self):
+        ckpt = Checkpoint(None)
+        ckpt.Save({"done": 1}, "pieces", cat=np.arange(3))
+        ckpt.Remove()
+        self.assertEqual(ckpt.Load(), None)
+        self.assertEqual(os.listdir(self.folder), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
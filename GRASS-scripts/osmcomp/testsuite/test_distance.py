@@ -0,0 +1,106 @@
+"""
+Tests of the distance pass (osmcomp.distance)
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from osmcomp import distance, synth
+from osmcomp.engine import CoveredLength
+from osmcomp.geom import PointSegmentDistance
+from osmcomp.segments import Segments
+
+
+def Nearest(x, y, seg):
+    """Distance of every point from the nearest segment, over all the pairs"""
+    return PointSegmentDistance(x[:, None], y[:, None], seg.x0[None, :], seg.y0[None, :],
+                                seg.x1[None, :], seg.y1[None, :]).min(axis=1)
+
+
+def Networks(n=5, seed=0):
+    lines = synth.PlanarNetwork(n, seed=seed)
+    return (Segments.FromLines(*lines),
+            Segments.FromLines(*synth.DeriveOSM(lines, noise=3.0, seed=seed)))
+
+
+class TestDensify(unittest.TestCase):
+
+    def test_pieces(self):
+        ref, osm = Networks()
+        (x, y, lengths, owner) = distance.Densify(ref, 7.0)
+        self.assertTrue(lengths.max() <= 7.0)
+        np.testing.assert_allclose(np.bincount(owner, lengths, len(ref)), ref.Length())
+        # midpoints lie on their segment
+        np.testing.assert_allclose(PointSegmentDistance(x, y, ref.x0[owner], ref.y0[owner],
+                                                        ref.x1[owner], ref.y1[owner]), 0.0, atol=1e-9)
+
+
+class TestNearestDistance(unittest.TestCase):
+
+    def test_brute_force(self):
+        ref, osm = Networks()
+        rng = np.random.RandomState(1)
+        x, y = rng.uniform(-50, 550, (2, 2000))
+        dist = distance.NearestDistance(x, y, ref, 30.0, chunk=300)
+        near = Nearest(x, y, ref)
+        np.testing.assert_allclose(dist[near <= 30.0], near[near <= 30.0])
+        self.assertTrue(np.all(np.isinf(dist[near > 30.0])))
+
+
+class TestLengthCurve(unittest.TestCase):
+
+    def test_chunks(self):
+        ref, osm = Networks()
+        values = [0.5, 2.0, 5.0, 20.0]
+        (x, y, lengths, owner) = distance.Densify(ref, 1.0)
+        whole = distance.LengthWithin(Nearest(x, y, osm), lengths, values)
+        for chunk in (1, 97, 10**6):
+            np.testing.assert_allclose(distance.LengthCurve(ref, osm, values, 1.0, chunk=chunk), whole)
+
+    def test_buffer_length(self):
+        # the error of a piece is at most half its length
+        ref, osm = Networks(4, seed=2)
+        curve = distance.LengthCurve(osm, ref, [3.0, 10.0], 0.05)
+        for (d, l) in zip([3.0, 10.0], curve):
+            self.assertAlmostEqual(l / CoveredLength(osm, ref, d).sum(), 1.0, delta=0.002)
+
+    def test_empty(self):
+        ref, osm = Networks(2)
+        np.testing.assert_array_equal(distance.LengthCurve(ref, osm.Take(slice(0, 0)), [1.0, 2.0], 1.0), [0.0, 0.0])
+
+
+class TestCoverDistance(unittest.TestCase):
+
+    def test_exact_lengths(self):
+        # the returned distance covers the fraction, acc less does not
+        ref, osm = Networks(4, seed=4)
+        total = osm.Length().sum()
+        fractions = [0.5, 0.9, 1.0]
+        acc = 0.01
+        found = distance.CoverDistance(osm, ref, fractions, 200.0, acc)
+        for (f, x) in zip(fractions, found):
+            self.assertTrue(CoveredLength(osm, ref, x).sum() >= f * total * (1 - 1e-9))
+            self.assertTrue(CoveredLength(osm, ref, x - 2 * acc).sum() < f * total)
+
+    def test_beyond_maxdist(self):
+        ref = Segments([0.0], [0.0], [10.0], [0.0], [1])
+        osm = Segments([0.0, 0.0], [1.0, 50.0], [10.0, 10.0], [1.0, 50.0], [1, 2])
+        found = distance.CoverDistance(osm, ref, [0.5, 1.0], 20.0, 0.005)
+        self.assertTrue(abs(found[0] - 1.0) <= 0.005)
+        self.assertTrue(np.isnan(found[1]))
+
+
+class TestPercentages(unittest.TestCase):
+
+    def test_dedupe(self):
+        values, names = distance.Percentages(["95", "95.0", 97.5, "100", 95])
+        self.assertEqual(values, [95.0, 97.5, 100.0])
+        self.assertEqual(names, ["TOL_95", "TOL_97_5", "TOL_100"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+"""
+Tests of the in-process comparison engine (osmcomp.engine)
+
+The library needs NumPy only, so the tests run without a GRASS session:
+
+    python -m unittest discover osmcomp/testsuite
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from osmcomp import synth
+from osmcomp.geom import AngleDiff
+from osmcomp.index import GridIndex
+from osmcomp.engine import ClipPairs, CoveredLength, MatchSegments, MatchTiled, MergeIntervals
+from osmcomp.segments import Segments
+
+
+def Seg(*coords):
+    """Segments from (x0, y0, x1, y1) tuples, categories 1, 2, ..."""
+    x0, y0, x1, y1 = np.array(coords, dtype=float).T
+    return Segments(x0, y0, x1, y1, np.arange(1, len(coords) + 1))
+
+
+def Merged(idx, t0, t1):
+    """Merged pieces sorted by segment, as a list of tuples"""
+    return list(zip(*[a.tolist() for a in MergeIntervals(idx, t0, t1)]))
+
+
+class TestGridIndex(unittest.TestCase):
+
+    def test_brute_force(self):
+        rng = np.random.RandomState(0)
+        lo = rng.uniform(0, 100, (2, 300))
+        hi = lo + rng.exponential(3.0, (2, 300))
+        qlo = rng.uniform(-10, 110, (2, 200))
+        qhi = qlo + rng.exponential(5.0, (2, 200))
+        index = GridIndex(lo[0], lo[1], hi[0], hi[1], 4.0)
+        qi, ei = index.Query(qlo[0], qlo[1], qhi[0], qhi[1])
+        hit = ((lo[0][None, :] <= qhi[0][:, None]) & (hi[0][None, :] >= qlo[0][:, None]) &
+               (lo[1][None, :] <= qhi[1][:, None]) & (hi[1][None, :] >= qlo[1][:, None]))
+        self.assertEqual(sorted(zip(qi.tolist(), ei.tolist())), sorted(zip(*[a.tolist() for a in np.nonzero(hit)])))
+
+    def test_empty_cells(self):
+        # a query inside the extent of the index touching only empty cells
+        index = GridIndex([0, 90], [0, 90], [1, 91], [1, 91], 1.0)
+        qi, ei = index.Query([50], [50], [51], [51])
+        self.assertEqual(qi.shape[0], 0)
+        self.assertEqual(GridIndex([], [], [], []).Query([0], [0], [1], [1])[0].shape[0], 0)
+
+
+class TestMergeIntervals(unittest.TestCase):
+
+    def test_overlapping(self):
+        idx = np.array([3, 1, 3, 1, 3])
+        t0 = np.array([0.5, 0.0, 0.0, 0.6, 0.9])
+        t1 = np.array([0.7, 0.4, 0.6, 1.0, 1.0])
+        np.testing.assert_allclose(Merged(idx, t0, t1), [(1, 0.0, 0.4), (1, 0.6, 1.0), (3, 0.0, 0.7), (3, 0.9, 1.0)])
+
+    def test_contained(self):
+        idx = np.array([0, 0, 0])
+        t0 = np.array([0.0, 0.1, 0.3])
+        t1 = np.array([0.8, 0.2, 0.9])
+        np.testing.assert_allclose(Merged(idx, t0, t1), [(0, 0.0, 0.9)])
+
+    def test_empty(self):
+        idx, t0, t1 = MergeIntervals(np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0))
+        self.assertEqual(idx.shape[0], 0)
+
+
+class TestClipPairs(unittest.TestCase):
+
+    def test_round_and_flat_caps(self):
+        ref = Seg((0, 0, 10, 0))
+        osm = Seg((-5, 1, 15, 1))
+        oi, t0, t1 = ClipPairs(ref, osm, np.array([0]), np.array([0]), 2.0)
+        # round caps reach sqrt(2^2 - 1^2) beyond the ends of REF
+        self.assertEqual(oi.tolist(), [0])
+        self.assertAlmostEqual(t0[0], (5 - np.sqrt(3)) / 20)
+        self.assertAlmostEqual(t1[0], (15 + np.sqrt(3)) / 20)
+        oi, t0, t1 = ClipPairs(ref, osm, np.array([0]), np.array([0]), 2.0, np.array([True]))
+        self.assertAlmostEqual(t0[0], 0.25)
+        self.assertAlmostEqual(t1[0], 0.75)
+
+    def test_outside(self):
+        ref = Seg((0, 0, 10, 0))
+        osm = Seg((0, 3, 10, 3))
+        oi, t0, t1 = ClipPairs(ref, osm, np.array([0]), np.array([0]), 2.0)
+        self.assertEqual(oi.shape[0], 0)
+
+
+class TestMatchSegments(unittest.TestCase):
+
+    def test_angle_filter(self):
+        ref = Seg((0, 0, 100, 0))
+        # parallel, reversed, 20 degrees off, crossing
+        osm = Seg((10, 1, 90, 1), (90, -1, 10, -1), (10, 0, 90, 80 * np.tan(np.radians(20))), (50, -50, 50, 50))
+        idx, t0, t1 = MatchSegments(ref, osm, 5.0, 10.0)
+        self.assertEqual(sorted(idx.tolist()), [0, 1])
+        np.testing.assert_allclose(t0, 0.0)
+        np.testing.assert_allclose(t1, 1.0)
+        idx, t0, t1 = MatchSegments(ref, osm, 5.0, 30.0)
+        self.assertEqual(sorted(idx.tolist()), [0, 1, 2])
+
+    def test_empty(self):
+        idx, t0, t1 = MatchSegments(Seg((0, 0, 1, 0)), Seg((0, 50, 1, 50)), 5.0, 10.0)
+        self.assertEqual(idx.shape[0], 0)
+
+    def test_pairs(self):
+        # every accepted piece is the clipping of an OSM segment to one REF buffer
+        ref = Segments.FromLines(*synth.PlanarNetwork(6))
+        osm = Segments.FromLines(*synth.DeriveOSM(synth.PlanarNetwork(6), noise=2.0))
+        idx, t0, t1 = MatchSegments(ref, osm, 5.0, 15.0, chunk=7)
+        self.assertTrue(idx.shape[0] > 0)
+        self.assertTrue(np.all((0 <= t0) & (t0 < t1) & (t1 <= 1)))
+        found = set(zip(idx.tolist(), np.round(t0, 9).tolist(), np.round(t1, 9).tolist()))
+        ri, oi = np.meshgrid(np.arange(len(ref)), np.arange(len(osm)), indexing="ij")
+        ri, oi = ri.ravel(), oi.ravel()
+        keep = AngleDiff(ref.Azimuth()[ri], osm.Azimuth()[oi]) <= 15.0
+        bi, b0, b1 = ClipPairs(ref, osm, ri[keep], oi[keep], 5.0)
+        self.assertEqual(found, set(zip(bi.tolist(), np.round(b0, 9).tolist(), np.round(b1, 9).tolist())))
+
+
+class TestMatchTiled(unittest.TestCase):
+
+    def test_same_as_untiled(self):
+        lines = synth.PlanarNetwork(8)
+        ref = Segments.FromLines(*lines)
+        osm = Segments.FromLines(*synth.DeriveOSM(lines, noise=2.0, seed=1))
+        flat = np.arange(len(ref)) % 3 == 0
+        whole = Merged(*MatchSegments(ref, osm, 5.0, 15.0, flat))
+        tiles = list(MatchTiled(ref, osm, 5.0, 15.0, 250.0, flat))
+        self.assertTrue(len(tiles) > 1)
+        self.assertEqual([t[0] for t in tiles], list(range(len(tiles))))
+        parts = [np.concatenate([t[i] for t in tiles]) for i in (1, 2, 3)]
+        np.testing.assert_allclose(np.array(Merged(*parts)), np.array(whole))
+
+    def test_processes(self):
+        lines = synth.PlanarNetwork(8)
+        ref = Segments.FromLines(*lines)
+        osm = Segments.FromLines(*synth.DeriveOSM(lines, noise=2.0, seed=1))
+        serial = list(MatchTiled(ref, osm, 5.0, 15.0, 250.0, start=1))
+        parallel = list(MatchTiled(ref, osm, 5.0, 15.0, 250.0, start=1, nprocs=3))
+        self.assertEqual([t[0] for t in parallel], [t[0] for t in serial])
+        for (a, b) in zip(parallel, serial):
+            for (x, y) in zip(a[1:], b[1:]):
+                np.testing.assert_array_equal(x, y)
+        # stopping early ends the pool
+        for found in MatchTiled(ref, osm, 5.0, 15.0, 100.0, nprocs=2):
+            break
+
+    def test_start(self):
+        lines = synth.GridNetwork(4)
+        ref = Segments.FromLines(*lines)
+        osm = Segments.FromLines(*synth.DeriveOSM(lines))
+        tiles = [t[0] for t in MatchTiled(ref, osm, 5.0, 15.0, 150.0)]
+        self.assertEqual([t[0] for t in MatchTiled(ref, osm, 5.0, 15.0, 150.0, start=2)], tiles[2:])
+
+
+class TestCoveredLength(unittest.TestCase):
+
+    def test_union_of_buffers(self):
+        seg = Seg((0, 0, 100, 0), (0, 50, 100, 50))
+        # overlapping buffers must not be counted twice
+        other = Seg((20, 1, 40, 1), (30, -1, 50, -1), (70, 0, 80, 0))
+        covered = CoveredLength(seg, other, 2.0)
+        self.assertAlmostEqual(covered[0], 30 + 2 * np.sqrt(3) + 14, places=6)
+        self.assertEqual(covered[1], 0.0)
+
+    def test_groups(self):
+        seg = Seg((0, 0, 10, 0), (0, 0, 10, 0))
+        other = Seg((0, 0, 10, 0))
+        covered = CoveredLength(seg, other, 1.0, np.array([1, 2]), np.array([2]))
+        np.testing.assert_allclose(covered, [0.0, 10.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Tests of the box fingerprints (osmcomp.fingerprint)
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from osmcomp import fingerprint, synth
+from osmcomp.segments import Segments
+
+BOXES = np.array([[0, 0, 150, 150], [150, 0, 300, 150], [0, 150, 300, 300], [1000, 1000, 1010, 1010]], dtype=float)
+
+
+def Network():
+    return Segments.FromLines(*synth.PlanarNetwork(3, seed=1))
+
+
+def Hashes(seg):
+    return fingerprint.BoxHashes(seg, *BOXES.T)
+
+
+def Meeting(seg, box):
+    """Segments whose bounding box meets the box, one at a time"""
+    return [i for i in range(len(seg)) if min(seg.x0[i], seg.x1[i]) <= box[2] and max(seg.x0[i], seg.x1[i]) >= box[0]
+            and min(seg.y0[i], seg.y1[i]) <= box[3] and max(seg.y0[i], seg.y1[i]) >= box[1]]
+
+
+class TestBoxHashes(unittest.TestCase):
+
+    def test_invariance(self):
+        seg = Network()
+        rng = np.random.RandomState(0)
+        order = rng.permutation(len(seg))
+        flip = rng.rand(len(seg)) < 0.5
+        other = Segments(np.where(flip, seg.x1, seg.x0)[order], np.where(flip, seg.y1, seg.y0)[order],
+                         np.where(flip, seg.x0, seg.x1)[order], np.where(flip, seg.y0, seg.y1)[order],
+                         rng.randint(1, 100, len(seg)))
+        self.assertEqual(Hashes(other), Hashes(seg))
+
+    def test_changes(self):
+        seg = Network()
+        before = Hashes(seg)
+        for i in (0, len(seg) // 2, len(seg) - 1):
+            # move one end point: exactly the boxes meeting the old or new segment change
+            x1 = seg.x1.copy()
+            x1[i] += 0.001
+            moved = Segments(seg.x0, seg.y0, x1, seg.y1, seg.cat)
+            after = Hashes(moved)
+            for (b, box) in enumerate(BOXES):
+                touched = i in Meeting(seg, box) or i in Meeting(moved, box)
+                self.assertEqual(after[b] != before[b], touched)
+        # removing a segment
+        after = Hashes(seg.Take(np.arange(1, len(seg))))
+        for (b, box) in enumerate(BOXES):
+            self.assertEqual(after[b] != before[b], 0 in Meeting(seg, box))
+
+    def test_empty_box(self):
+        seg = Network()
+        self.assertEqual(Hashes(seg)[3], Hashes(seg.Take(slice(0, 1)))[3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+"""
+Tests of the Douglas-Peucker generalization (osmcomp.generalize)
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from osmcomp import synth
+from osmcomp.generalize import Generalize, Simplify
+from osmcomp.geom import PointSegmentDistance
+
+
+def Reference(xy, thres):
+    """Indices kept by the recursive Douglas-Peucker algorithm on one line"""
+    keep = set([0, xy.shape[0] - 1])
+
+    def Split(s, e):
+        if e - s < 2:
+            return
+        d = PointSegmentDistance(xy[s + 1:e, 0], xy[s + 1:e, 1], xy[s, 0], xy[s, 1], xy[e, 0], xy[e, 1])
+        m = s + 1 + int(np.argmax(d))
+        if d.max() > thres:
+            keep.add(m)
+            Split(s, m)
+            Split(m, e)
+
+    Split(0, xy.shape[0] - 1)
+    return sorted(keep)
+
+
+def Lines(count=40, seed=0):
+    """Random walks of various lengths as (cats, offsets, xy)"""
+    rng = np.random.RandomState(seed)
+    paths = [np.cumsum(rng.normal(0.0, 5.0, (rng.randint(1, 60), 2)), axis=0) for i in range(count)]
+    nvert = np.array([p.shape[0] for p in paths])
+    return np.arange(1, count + 1), np.cumsum(nvert) - nvert, np.concatenate(paths)
+
+
+class TestSimplify(unittest.TestCase):
+
+    def test_reference(self):
+        cats, offsets, xy = Lines()
+        for thres in (0.0, 2.0, 10.0, 1e9):
+            keep = Simplify(offsets, xy, thres)
+            ends = np.append(offsets, xy.shape[0])
+            for s, e in zip(ends[:-1], ends[1:]):
+                self.assertEqual(np.flatnonzero(keep[s:e]).tolist(), Reference(xy[s:e], thres))
+
+    def test_straight(self):
+        xy = np.column_stack((np.arange(10.0), 2 * np.arange(10.0)))
+        self.assertEqual(np.flatnonzero(Simplify(np.array([0]), xy, 0.1)).tolist(), [0, 9])
+
+    def test_closed(self):
+        # the ends coincide: distances are measured to the start point
+        xy = np.array([(0, 0), (5, 0.1), (10, 0), (10, 10), (0, 10), (0, 0)], dtype=float)
+        self.assertEqual(np.flatnonzero(Simplify(np.array([0]), xy, 1.0)).tolist(), [0, 2, 3, 4, 5])
+
+    def test_short_lines(self):
+        xy = np.array([(0, 0), (1, 0), (2, 0), (5, 5)], dtype=float)
+        keep = Simplify(np.array([0, 1, 3]), xy, 1.0)
+        self.assertEqual(keep.tolist(), [True, True, True, True])
+
+
+class TestGeneralize(unittest.TestCase):
+
+    def test_layout(self):
+        lines = synth.PlanarNetwork(5, vertices=6)
+        cats, offsets, xy = Generalize(*lines, thres=1.0)
+        self.assertEqual(cats.tolist(), lines[0].tolist())
+        # straight synthetic roads keep their two ends only
+        np.testing.assert_array_equal(offsets, 2 * np.arange(offsets.shape[0]))
+        np.testing.assert_array_equal(xy, lines[2][Simplify(lines[1], lines[2], 1.0)])
+
+    def test_processes(self):
+        lines = Lines(200, seed=1)
+        serial = Generalize(*lines, thres=3.0)
+        for nprocs in (2, 3):
+            for a, b in zip(Generalize(*lines, thres=3.0, nprocs=nprocs), serial):
+                np.testing.assert_array_equal(a, b)
+
+
+if __name__ == "__main__":
+    unittest.main()
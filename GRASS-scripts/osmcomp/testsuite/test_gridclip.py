@@ -0,0 +1,105 @@
+"""
+Tests of the clipping of networks to grid boxes (osmcomp.gridclip)
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from osmcomp import gridclip, synth
+from osmcomp.segments import Segments
+
+try:
+    gridclip._Shapely()
+    HAS_SHAPELY = True
+except ImportError:
+    HAS_SHAPELY = False
+
+
+def Network():
+    lines = synth.PlanarNetwork(5, vertices=3)
+    return Segments.FromLines(*synth.DeriveOSM(lines, noise=2.0, seed=5))
+
+
+def InsideLength(seg, xmin, ymin, xmax, ymax):
+    """Length of every segment inside a rectangle (Liang-Barsky, one segment at a time)"""
+    found = []
+    for (ax, ay, bx, by) in zip(seg.x0, seg.y0, seg.x1, seg.y1):
+        t0, t1 = 0.0, 1.0
+        for (p, q) in ((ax - bx, ax - xmin), (bx - ax, xmax - ax), (ay - by, ay - ymin), (by - ay, ymax - ay)):
+            if p == 0:
+                if q < 0:
+                    t0, t1 = 1.0, 0.0
+            elif p < 0:
+                t0 = max(t0, q / p)
+            else:
+                t1 = min(t1, q / p)
+        found.append(max(t1 - t0, 0.0) * np.hypot(bx - ax, by - ay))
+    return np.array(found)
+
+
+class TestClipToGrid(unittest.TestCase):
+
+    def test_box_lengths(self):
+        seg = Network()
+        (west, north, ewres, nsres, rows, cols) = (-20.0, 480.0, 70.0, 55.0, 8, 6)
+        box, pieces = gridclip.ClipToGrid(seg, west, north, ewres, nsres, rows, cols)
+        found = gridclip.BoxLength(box, pieces, rows * cols)
+        for r in range(rows):
+            for c in range(cols):
+                (xmin, ymax) = (west + c * ewres, north - r * nsres)
+                expected = InsideLength(seg, xmin, ymax - nsres, xmin + ewres, ymax).sum()
+                self.assertAlmostEqual(found[r * cols + c], expected, places=6)
+        # every piece lies in its box
+        col = box % cols
+        row = box // cols
+        for (x, y) in ((pieces.x0, pieces.y0), (pieces.x1, pieces.y1)):
+            self.assertTrue(np.all((x >= west + col * ewres - 1e-6) & (x <= west + (col + 1) * ewres + 1e-6)))
+            self.assertTrue(np.all((y <= north - row * nsres + 1e-6) & (y >= north - (row + 1) * nsres - 1e-6)))
+        np.testing.assert_array_equal(np.isin(pieces.cat, seg.cat), True)
+
+
+class TestClipToBoxes(unittest.TestCase):
+
+    def test_overlapping(self):
+        seg = Network()
+        boxes = np.array([[0, 0, 200, 200], [100, 100, 350, 300], [-50, 250, 600, 260], [400, 400, 410, 410]], dtype=float)
+        box, pieces = gridclip.ClipToBoxes(seg, *boxes.T)
+        found = gridclip.BoxLength(box, pieces, boxes.shape[0])
+        for (b, expected) in enumerate(boxes):
+            self.assertAlmostEqual(found[b], InsideLength(seg, *expected).sum(), places=6)
+        (order, cut) = gridclip.ByBox(box, boxes.shape[0])
+        for b in range(boxes.shape[0]):
+            self.assertTrue(np.all(box[order[cut[b]:cut[b + 1]]] == b))
+
+
+@unittest.skipUnless(HAS_SHAPELY, "shapely >= 2.0 is not installed")
+class TestClipToPolygons(unittest.TestCase):
+
+    def test_shapely_lengths(self):
+        import shapely
+        seg = Network()
+        polygons = ["POLYGON ((0 0, 300 0, 150 250, 0 0))",
+                    "POLYGON ((100 100, 400 100, 400 400, 100 400, 100 100), (200 200, 300 200, 300 300, 200 300, 200 200))",
+                    "POLYGON ((-100 -100, -90 -100, -90 -90, -100 -100))"]
+        poly, pieces = gridclip.ClipToPolygons(seg, polygons, chunk=50)
+        found = gridclip.BoxLength(poly, pieces, len(polygons))
+        network = shapely.multilinestrings(np.stack((seg.x0, seg.y0, seg.x1, seg.y1), axis=1).reshape(-1, 2, 2))
+        for (p, wkt) in enumerate(polygons):
+            expected = shapely.length(shapely.intersection(network, shapely.from_wkt(wkt)))
+            self.assertAlmostEqual(found[p], expected, places=6)
+
+    def test_boxes(self):
+        seg = Network()
+        boxes = [(0, 0, 200, 200), (200, 0, 400, 200)]
+        polygons = ["POLYGON ((%s %s, %s %s, %s %s, %s %s, %s %s))" % (w, s, e, s, e, n, w, n, w, s) for (w, s, e, n) in boxes]
+        poly, pieces = gridclip.ClipToPolygons(seg, polygons)
+        box, expected = gridclip.ClipToBoxes(seg, *np.array(boxes, dtype=float).T)
+        np.testing.assert_allclose(gridclip.BoxLength(poly, pieces, 2), gridclip.BoxLength(box, expected, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
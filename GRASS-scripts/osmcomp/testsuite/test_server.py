@@ -0,0 +1,123 @@
+"""
+Tests of the comparison server (osmcomp.server)
+"""
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from osmcomp import server, synth
+from osmcomp.distance import Densify
+from osmcomp.engine import CoveredLength
+from osmcomp.geom import PointSegmentDistance
+from osmcomp.segments import Segments
+
+try:
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import Request, urlopen, HTTPError
+
+
+def Networks():
+    lines = synth.PlanarNetwork(5)
+    return {"ref": Segments.FromLines(*lines),
+            "osm": Segments.FromLines(*synth.DeriveOSM(lines, noise=2.0, seed=3))}
+
+
+def MakeComparison(networks, step=0.5, maxdist=50.0):
+    return server.Comparison(lambda name: 0, lambda name: networks[name], step, maxdist, 2**30)
+
+
+def Nearest(x, y, seg):
+    """Distance of every point from the nearest segment, over all the pairs"""
+    return PointSegmentDistance(x[:, None], y[:, None], seg.x0[None, :], seg.y0[None, :],
+                                seg.x1[None, :], seg.y1[None, :]).min(axis=1)
+
+
+class TestComparison(unittest.TestCase):
+
+    def setUp(self):
+        self.networks = Networks()
+        self.comparison = MakeComparison(self.networks)
+
+    def test_precomp(self):
+        ref, osm = self.networks["ref"], self.networks["osm"]
+        res = self.comparison.Handle({"op": "precomp", "osm": "osm", "ref": "ref", "buffers": [1, 3, 10]})
+        for (i, b) in enumerate(res["buffers"]):
+            # the pieces are 0.5 long: only the ones crossing the buffer border may differ
+            self.assertAlmostEqual(res["ref_in"][i] / CoveredLength(ref, osm, b).sum(), 1.0, delta=0.01)
+            self.assertAlmostEqual(res["osm_in"][i] / CoveredLength(osm, ref, b).sum(), 1.0, delta=0.01)
+            self.assertAlmostEqual(res["osm_in"][i] + res["osm_out"][i], osm.Length().sum())
+
+    def test_acc_tol_eval(self):
+        ref, osm = self.networks["ref"], self.networks["osm"]
+        boxes = [[0, 0, 250, 250], [250, 0, 550, 250], [0, 250, 550, 550]]
+        res = self.comparison.Handle({"op": "acc", "osm": "osm", "ref": "ref", "boxes": boxes, "tol_eval": [2, 5]})
+        (x, y, lengths, owner) = Densify(osm, 0.5)
+        dist = Nearest(x, y, ref)
+        for (box, r) in zip(boxes, res["boxes"]):
+            inside = (x >= box[0]) & (x <= box[2]) & (y >= box[1]) & (y <= box[3])
+            self.assertAlmostEqual(r["OSM"], lengths[inside].sum())
+            for t in (2, 5):
+                self.assertAlmostEqual(r["t_%s" % t], lengths[inside & (dist <= t)].sum())
+
+    def test_acc_perc(self):
+        boxes = [[-100, -100, 600, 600]]
+        req = {"op": "acc", "osm": "osm", "ref": "ref", "boxes": boxes, "tol_max": 50}
+        res = self.comparison.Handle(dict(req, perc=[50, 50.0, 97.5]))["boxes"][0]
+        self.assertEqual(sorted(res), ["OSM", "TOL_50", "TOL_97_5"])
+        self.assertTrue(res["TOL_50"] <= res["TOL_97_5"])
+        self.assertEqual(self.comparison.Handle(dict(req, perc=97.5))["boxes"][0]["TOL"], res["TOL_97_5"])
+
+    def test_checks(self):
+        self.assertEqual(server._Answer(self.comparison, {"op": "nothing"})[0], 400)
+        req = {"op": "precomp", "osm": "osm", "ref": "ref", "buffers": [100]}
+        self.assertEqual(server._Answer(self.comparison, req)[0], 400)
+        self.assertEqual(server._Answer(self.comparison, {"op": "status"})[0], 200)
+
+
+class Fatal(object):
+    """Comparison whose acc requests end as grass.fatal does"""
+
+    def Handle(self, req):
+        if req["op"] == "acc":
+            sys.exit(1)
+        return {"op": req["op"]}
+
+
+class TestServe(unittest.TestCase):
+
+    def test_worker_survives_exit(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        thread = threading.Thread(target=server.Serve, args=(Fatal(), "127.0.0.1", port, 10, 5.0))
+        thread.daemon = True
+        thread.start()
+        url = "http://127.0.0.1:%d/" % port
+        for i in range(50):
+            try:
+                urlopen(url + "status", timeout=5).read()
+                break
+            except IOError:
+                time.sleep(0.1)
+        try:
+            urlopen(Request(url + "acc", json.dumps({}).encode("utf-8")), timeout=10)
+            self.fail("the request should fail")
+        except HTTPError as e:
+            self.assertEqual(e.code, 500)
+        # the worker thread is still there to answer
+        self.assertEqual(json.loads(urlopen(url + "status", timeout=10).read().decode("utf-8")), {"op": "status"})
+
+
+if __name__ == "__main__":
+    unittest.main()
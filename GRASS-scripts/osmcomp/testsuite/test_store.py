@@ -0,0 +1,91 @@
+"""
+Tests of the segment store (osmcomp.store) and of vectio.ReadSegments
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakegrass import FakeGrass
+from osmcomp import store, synth, vectio
+from osmcomp.segments import Segments
+
+
+def AssertSame(test, a, b):
+    for f in ("x0", "y0", "x1", "y1", "cat"):
+        np.testing.assert_array_equal(getattr(a, f), getattr(b, f))
+    np.testing.assert_allclose(a.Length(), np.hypot(b.x1 - b.x0, b.y1 - b.y0))
+
+
+class TestStore(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_round_trip(self):
+        seg = Segments.FromLines(*synth.RadialNetwork(4))
+        path = os.path.join(self.folder, "seg.npy")
+        store.Save(path, seg)
+        found = store.Open(path)
+        AssertSame(self, found, seg)
+        np.testing.assert_array_equal(found.fid, seg.fid)
+        np.testing.assert_allclose(found.Azimuth(), seg.Azimuth())
+        self.assertEqual(os.path.getsize(path) // len(seg), store.DTYPE.itemsize)
+        self.assertEqual(os.listdir(self.folder), ["seg.npy"])
+
+
+class TestReadSegments(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.grass = FakeGrass(self.folder)
+        self.saved = vectio.grass
+        vectio.grass = self.grass
+        vectio.Forget()
+
+    def tearDown(self):
+        vectio.Forget()
+        vectio.grass = self.saved
+        shutil.rmtree(self.folder)
+
+    def Stores(self):
+        folder = os.path.join(self.grass.mapset, ".osmcomp")
+        return sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+
+    def test_store(self):
+        lines = synth.GridNetwork(3)
+        self.grass.WriteMap("roads", lines)
+        AssertSame(self, vectio.ReadSegments("roads"), Segments.FromLines(*lines))
+        self.assertEqual(len(self.Stores()), 1)
+        # a new process: the store is read instead of the map
+        vectio.Forget()
+        del self.grass.calls[:]
+        AssertSame(self, vectio.ReadSegments("roads"), Segments.FromLines(*lines))
+        self.assertEqual(self.grass.calls, [])
+        # the map changes: its store is replaced
+        lines = synth.PlanarNetwork(3)
+        self.grass.WriteMap("roads", lines)
+        AssertSame(self, vectio.ReadSegments("roads"), Segments.FromLines(*lines))
+        self.assertEqual(len(self.Stores()), 1)
+        self.grass.WriteMap("other", lines)
+        vectio.ReadSegments("other")
+        self.assertEqual(len(self.Stores()), 2)
+
+    def test_temporary(self):
+        lines = synth.GridNetwork(2)
+        self.grass.WriteMap("roi_1", lines)
+        AssertSame(self, vectio.ReadSegments("roi_1", temporary=True), Segments.FromLines(*lines))
+        self.assertEqual(self.Stores(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Tests of the concurrent execution of steps (osmcomp.tasks)
+"""
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from osmcomp.tasks import TaskGraph
+
+
+class TestTaskGraph(unittest.TestCase):
+
+    def Graph(self, workers, log):
+        """Diamond a -> (b, c) -> d logging the order of the steps"""
+        def Step(name, value):
+            def Func(*args):
+                log.append(name)
+                return value + sum(args)
+            return Func
+        graph = TaskGraph(workers)
+        graph.Add("a", Step("a", 1))
+        graph.Add("b", Step("b", 10), ["a"])
+        graph.Add("c", Step("c", 100), ["a"])
+        graph.Add("d", Step("d", 1000), ["b", "c"])
+        return graph
+
+    def test_results(self):
+        for workers in (1, 2, 4):
+            log = []
+            results = self.Graph(workers, log).Run()
+            self.assertEqual(results, {"a": 1, "b": 11, "c": 101, "d": 1112})
+            self.assertEqual(log[0], "a")
+            self.assertEqual(log[-1], "d")
+        log = []
+        self.Graph(1, log).Run()
+        self.assertEqual(log, ["a", "b", "c", "d"])
+
+    def test_add(self):
+        graph = TaskGraph(2)
+        graph.Add("a", int)
+        self.assertRaises(ValueError, graph.Add, "a", int)
+        self.assertRaises(ValueError, graph.Add, "b", int, ["c"])
+
+    def test_concurrent(self):
+        # each step waits for the other one to start
+        started = dict((name, threading.Event()) for name in "ab")
+
+        def Step(name, other):
+            def Func():
+                started[name].set()
+                return started[other].wait(5)
+            return Func
+        graph = TaskGraph(2)
+        graph.Add("a", Step("a", "b"))
+        graph.Add("b", Step("b", "a"))
+        self.assertEqual(graph.Run(), {"a": True, "b": True})
+
+    def test_workers(self):
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+
+        def Func():
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.02)
+            with lock:
+                state["running"] -= 1
+        graph = TaskGraph(3)
+        for i in range(10):
+            graph.Add(str(i), Func)
+        graph.Run()
+        self.assertEqual(state["peak"], 3)
+
+    def test_exception(self):
+        log = []
+
+        def Fail():
+            raise RuntimeError("failed")
+        graph = TaskGraph(2)
+        graph.Add("a", Fail)
+        graph.Add("b", lambda x: log.append("b"), ["a"])
+        self.assertRaises(RuntimeError, graph.Run)
+        self.assertEqual(log, [])
+
+    def test_exit(self):
+        # grass.fatal raises SystemExit: Run must not wait for the step forever
+        def Fatal():
+            sys.exit(1)
+        graph = TaskGraph(2)
+        graph.Add("a", Fatal)
+        graph.Add("b", lambda: time.sleep(0.05))
+        self.assertRaises(SystemExit, graph.Run)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Tests of the node topology of segment networks (osmcomp.topology)
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from osmcomp import synth, topology
+from osmcomp.segments import Segments
+
+
+def Degrees(seg):
+    """Degree of the node of every end point, counting equal points one pair at a time"""
+    points = list(zip(seg.x0, seg.y0)) + list(zip(seg.x1, seg.y1))
+    return np.array([sum(1 for q in points if q == p) for p in points])
+
+
+class TestNodes(unittest.TestCase):
+
+    def test_brute_force(self):
+        seg = Segments.FromLines(*synth.PlanarNetwork(4, drop=0.3))
+        node, degree = topology.Nodes(seg)
+        np.testing.assert_array_equal(degree[node], Degrees(seg))
+        # the same node for the same point only
+        points = np.concatenate((np.column_stack((seg.x0, seg.y0)), np.column_stack((seg.x1, seg.y1))))
+        for i in range(0, points.shape[0], 7):
+            same = np.all(points == points[i], axis=1)
+            np.testing.assert_array_equal(node == node[i], same)
+
+    def test_snap(self):
+        seg = Segments([0.0, 10.0, 10.004], [0.0, 0.0, 0.003], [10.0, 20.0, 10.0], [0.0, 0.0, 10.0], [1, 2, 3])
+        self.assertEqual(topology.Nodes(seg)[1].max(), 2)
+        node, degree = topology.Nodes(seg, snap=0.01)
+        self.assertEqual(degree[node[1]], 3)
+
+
+class TestMinDegreeCats(unittest.TestCase):
+
+    def test_dangles(self):
+        seg = Segments.FromLines(*synth.PlanarNetwork(4, drop=0.3, seed=2))
+        degree = Degrees(seg)
+        n = len(seg)
+        low = degree == degree.min()
+        expected = sorted(set(seg.cat[low[:n] | low[n:]].tolist()))
+        self.assertEqual(topology.MinDegreeCats(seg).tolist(), expected)
+        self.assertEqual(degree.min(), 1)
+
+    def test_cycle(self):
+        # every node of a closed ring has degree 2: all the segments qualify
+        x = np.array([0.0, 1.0, 1.0, 0.0])
+        y = np.array([0.0, 0.0, 1.0, 1.0])
+        seg = Segments(x, y, np.roll(x, -1), np.roll(y, -1), [5, 6, 7, 8])
+        self.assertEqual(topology.MinDegreeCats(seg).tolist(), [5, 6, 7, 8])
+        self.assertEqual(topology.MinDegreeCats(seg.Take(slice(0, 0))).shape[0], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+Tests of the comparison workspace (osmcomp.workspace)
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakegrass import FakeGrass
+from osmcomp import distance, synth, vectio
+from osmcomp.segments import Segments
+from osmcomp.workspace import Workspace
+
+
+class TestWorkspace(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.grass = FakeGrass(self.folder)
+        self.saved = vectio.grass
+        vectio.grass = self.grass
+        vectio.Forget()
+        lines = synth.PlanarNetwork(4)
+        self.lines = {"ref": lines, "osm": synth.DeriveOSM(lines, noise=2.0)}
+        for (name, l) in self.lines.items():
+            self.grass.WriteMap(name, l)
+        self.path = os.path.join(self.folder, "ws.npz")
+
+    def tearDown(self):
+        vectio.Forget()
+        vectio.grass = self.saved
+        shutil.rmtree(self.folder)
+
+    def Reopen(self, ws):
+        """Save the workspace and open it again as a new run would, with no map read since"""
+        ws.Save()
+        vectio.Forget()
+        del self.grass.calls[:]
+        return Workspace(self.path)
+
+    def test_shared(self):
+        ws = Workspace(self.path)
+        length = ws.Length("ref")
+        seg = ws.Segments("osm")
+        curve = ws.Curve("ref", "osm", 0.5, [1.0, 5.0])
+        ref = Segments.FromLines(*self.lines["ref"])
+        osm = Segments.FromLines(*self.lines["osm"])
+        self.assertAlmostEqual(length, ref.Length().sum())
+        np.testing.assert_allclose(curve, distance.LengthCurve(ref, osm, [1.0, 5.0], 0.5))
+        ws = self.Reopen(ws)
+        self.assertEqual(ws.Length("ref"), length)
+        np.testing.assert_array_equal(ws.Segments("osm").x0, seg.x0)
+        np.testing.assert_array_equal(ws.Curve("ref", "osm", 0.5, [5.0, 1.0]), curve[::-1])
+        # nothing was read from the maps
+        self.assertEqual(self.grass.calls, [])
+        ws.npz.close()
+
+    def test_curve_points(self):
+        ws = Workspace(self.path)
+        ws.Curve("ref", "osm", 0.5, [1.0])
+        ws = self.Reopen(ws)
+        both = ws.Curve("ref", "osm", 0.5, [1.0, 2.0])
+        self.assertTrue(ws.changed)
+        self.assertEqual(sorted(v for (v, l) in ws.meta["curve_%s_%s" % (vectio.ContentHash("ref"), vectio.ContentHash("osm"))]["within"]), [1.0, 2.0])
+        # another step is computed again and replaces the stored curve
+        other = ws.Curve("ref", "osm", 2.0, [1.0, 2.0])
+        self.assertFalse(np.array_equal(other, both))
+        ws.Save()
+        ws.npz.close()
+
+    def test_changed_map(self):
+        ws = Workspace(self.path)
+        ws.Length("ref")
+        ws = self.Reopen(ws)
+        self.grass.WriteMap("ref", synth.GridNetwork(2))
+        self.assertAlmostEqual(ws.Length("ref"), Segments.FromLines(*synth.GridNetwork(2)).Length().sum())
+        ws.npz.close()
+
+    def test_disabled(self):
+        ws = Workspace()
+        np.testing.assert_allclose(ws.Curve("ref", "osm", 0.5, [1.0]), ws.Curve("ref", "osm", 0.5, [1.0]))
+        ws.Save()
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
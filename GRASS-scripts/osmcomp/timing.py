@@ -0,0 +1,93 @@
+"""
+Opt-in profiling of the v.osm.* modules
+
+A Profiler wraps the command functions of grass.script so that every GRASS
+command launched by a module is counted and timed, and splits the run into
+named stages. The trace is written as JSON:
+
+    {"module": ..., "wall": ..., "commands": {...},
+     "stages": [{"name": ..., "wall": ..., "features": ..., "commands": {...}}]}
+
+where "commands" maps every GRASS module name to its number of calls and
+total wall time. Commands launched by worker processes are not counted.
+"""
+import json
+import threading
+import time
+
+## Functions of grass.script launching a GRASS command
+WRAPPED = ("run_command", "read_command", "write_command", "parse_command",
+           "start_command", "pipe_command", "feed_command")
+
+
+def _Add(commands, prog, wall):
+    entry = commands.setdefault(prog, {"calls": 0, "wall": 0.0})
+    entry["calls"] += 1
+    entry["wall"] += wall
+
+
+class Profiler(object):
+    """Collect per-stage timing; does nothing when no output file is given"""
+
+    def __init__(self, module, output=None):
+        self.module = module
+        self.output = output
+        self.enabled = bool(output)
+        self.start = time.time()
+        self.commands = {}
+        self.stages = []
+        self.current = None
+        self.lock = threading.Lock()
+
+    def Install(self, grass):
+        """Wrap the command functions of the grass.script module"""
+        if not self.enabled:
+            return
+        for name in WRAPPED:
+            if hasattr(grass, name):
+                setattr(grass, name, self._Wrap(getattr(grass, name)))
+
+    def _Wrap(self, func):
+        def Wrapper(prog, *args, **kwargs):
+            t = time.time()
+            try:
+                return func(prog, *args, **kwargs)
+            finally:
+                wall = time.time() - t
+                # commands may be launched by several threads (see tasks.TaskGraph)
+                with self.lock:
+                    _Add(self.commands, prog, wall)
+                    if self.current is not None:
+                        _Add(self.current["commands"], prog, wall)
+        Wrapper.__name__ = func.__name__
+        Wrapper.__doc__ = func.__doc__
+        return Wrapper
+
+    def Stage(self, name, features=None):
+        """Close the current stage and start a new one"""
+        if not self.enabled:
+            return
+        self._Close()
+        self.current = {"name": name, "start": time.time(), "features": features, "commands": {}}
+
+    def Count(self, features):
+        """Set the number of features processed by the current stage"""
+        if self.enabled and self.current is not None:
+            self.current["features"] = features
+
+    def _Close(self):
+        if self.current is not None:
+            self.current["wall"] = time.time() - self.current.pop("start")
+            self.stages.append(self.current)
+            self.current = None
+
+    def Write(self):
+        """Close the current stage and write the JSON trace"""
+        if not self.enabled:
+            return
+        self._Close()
+        trace = {"module": self.module, "wall": time.time() - self.start,
+                 "commands": self.commands, "stages": self.stages}
+        fil = open(self.output, "w")
+        json.dump(trace, fil, indent=2, sort_keys=True)
+        fil.close()
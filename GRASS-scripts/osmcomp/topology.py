@@ -0,0 +1,44 @@
+"""
+Node topology of a segment network
+
+Nodes are the distinct segment end points, found in one vectorized pass
+over the sorted (optionally snapped) end point coordinates.
+"""
+import numpy as np
+
+
+def Nodes(seg, snap=0.0):
+    """Return the node of every end point and the degree of every node
+
+    End points are numbered as the starts of all the segments followed by
+    their ends; end points closer than snap (on a grid of that size) share
+    a node, with snap=0 only identical coordinates do.
+    """
+    x = np.concatenate((seg.x0, seg.x1))
+    y = np.concatenate((seg.y0, seg.y1))
+    if snap > 0:
+        x = np.round(x / snap)
+        y = np.round(y / snap)
+    order = np.lexsort((y, x))
+    xs = x[order]
+    ys = y[order]
+    new = np.ones(x.shape[0], dtype=bool)
+    new[1:] = (xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1])
+    node = np.empty(x.shape[0], dtype=np.int64)
+    node[order] = np.cumsum(new) - 1
+    return node, np.bincount(node)
+
+
+def MinDegreeCats(seg, snap=0.0):
+    """Return the categories of the segments with an end at a node of minimum degree
+
+    This is the set of lines v.net.centrality and v.select find from the
+    minimum-degree nodes; in a network with dangling ends those are the
+    segments ending at a degree-one node.
+    """
+    if len(seg) == 0:
+        return np.zeros(0, dtype=np.int64)
+    node, degree = Nodes(seg, snap)
+    low = degree[node] == degree.min()
+    n = len(seg)
+    return np.unique(seg.cat[low[:n] | low[n:]])
@@ -0,0 +1,262 @@
+"""
+Bulk transfer of line geometries between GRASS vector maps and arrays
+
+Geometries read from a map are memoized by map name and modification
+stamp, so asking again for an unchanged map costs nothing; only the
+MEMO_SIZE most recently used entries are kept, and the folder of a map is
+asked to GRASS only once. The split
+segments of a map are also kept on disk in a segment store in the
+.osmcomp folder of the current mapset (see ReadSegments).
+"""
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+import grass.script as grass
+
+from . import store
+from .segments import Segments
+
+## Number of memoized entries (a few per map)
+MEMO_SIZE = 32
+
+_memo = OrderedDict()
+_paths = {}
+
+
+def _Locate(vect):
+    """Return the full name and the folder of a map, asking GRASS the first time"""
+    if vect not in _paths:
+        if len(_paths) >= 1024:
+            # names of temporary maps that were not forgotten
+            _paths.clear()
+        info = grass.find_file(name=vect, element="vector")
+        _paths[vect] = (info["fullname"], info["file"])
+    return _paths[vect]
+
+
+def MapStamp(vect):
+    """Return (full name, stamp) where stamp changes with the map geometry"""
+    name, folder = _Locate(vect)
+    try:
+        st = os.stat(os.path.join(folder, "coor"))
+    except OSError:
+        # removed meanwhile: look for the map again
+        _paths.pop(vect, None)
+        name, folder = _Locate(vect)
+        st = os.stat(os.path.join(folder, "coor"))
+    return name, (st.st_ino, st.st_mtime, st.st_size)
+
+
+def _Memo(vect, what, func):
+    name, stamp = MapStamp(vect)
+    key = (name, what)
+    found = _memo.pop(key, None)
+    if found is None or found[0] != stamp:
+        found = (stamp, func())
+    _memo[key] = found
+    while len(_memo) > MEMO_SIZE:
+        _memo.popitem(last=False)
+    return found[1]
+
+
+def Forget(vect=None):
+    """Drop the memoized data of a map (of all maps if vect is None)
+
+    To be called before removing temporary maps.
+    """
+    if vect is None:
+        _memo.clear()
+        _paths.clear()
+        return
+    if vect not in _paths:
+        return
+    name = _paths.pop(vect)[0]
+    for key in [k for k in _memo if k[0] == name]:
+        del _memo[key]
+
+
+def ContentHash(vect):
+    """Return the SHA-1 of the map geometry (and of the kind of coordinates)
+
+    This is the key used by the persistent cache: unlike MapStamp it is the
+    same for identical maps, whatever their name or creation time.
+    """
+    def Compute():
+        sha = hashlib.sha1(b"latlong" if grass.locn_is_latlong() else b"planar")
+        fil = open(os.path.join(_Locate(vect)[1], "coor"), "rb")
+        for block in iter(lambda: fil.read(2**20), b""):
+            sha.update(block)
+        fil.close()
+        return sha.hexdigest()
+    return _Memo(vect, "hash", Compute)
+
+
+def CachedMap(cache, key, vect, func):
+    """Create the map vect with func(), or restore it from the cache entry key
+
+    New maps are stored in the cache with v.pack, cached ones are restored
+    with v.unpack.
+    """
+    if not cache.enabled:
+        func()
+    elif cache.Hit(key, ".pack"):
+        grass.run_command("v.unpack", input=cache.Path(key, ".pack"), output=vect, flags="o", quiet=True)
+    else:
+        func()
+        cache.Store(key, ".pack", lambda name: grass.run_command("v.pack", input=vect, output=name, overwrite=True, quiet=True))
+
+
+def ReadLines(vect, layer=1):
+    """Read all the lines of a vector map with a single v.out.ascii call
+
+    Return (cats, offsets, xy): the category of every line in the given
+    layer (-1 if missing), the index of its first vertex in xy and the Nx2
+    array of vertex coordinates.
+    """
+    return _Memo(vect, ("lines", layer), lambda: _ReadLines(vect, layer))
+
+
+def _ReadLines(vect, layer):
+    data = grass.read_command("v.out.ascii", input=vect, type="line", format="standard", quiet=True)
+    cats = []
+    offsets = []
+    xy = []
+    rows = iter(data.splitlines())
+    for row in rows:
+        if row.startswith("VERTI:"):
+            break
+    for row in rows:
+        head = row.split()
+        if not head or head[0] not in ("L", "l"):
+            continue
+        nvert = int(head[1])
+        ncats = int(head[2]) if len(head) > 2 else 0
+        offsets.append(len(xy))
+        for v in range(nvert):
+            c = next(rows).split()
+            xy.append((float(c[0]), float(c[1])))
+        cat = -1
+        for c in range(ncats):
+            lc = next(rows).split()
+            if int(lc[0]) == layer and cat < 0:
+                cat = int(lc[1])
+        cats.append(cat)
+    return (np.array(cats, dtype=np.int64), np.array(offsets, dtype=np.int64),
+            np.array(xy, dtype=float).reshape(-1, 2))
+
+
+def ReadAreas(vect, layer=1):
+    """Read the areas of a vector map
+
+    Return the category of every area with a centroid (in the given layer,
+    -1 if missing) and the list of their WKT polygons.
+    """
+    return _Memo(vect, ("areas", layer), lambda: _ReadAreas(vect, layer))
+
+
+def _ReadAreas(vect, layer):
+    from grass.pygrass.vector import VectorTopo
+    cats = []
+    wkt = []
+    vmap = VectorTopo(vect)
+    vmap.open("r", layer=layer)
+    try:
+        for area in vmap.viter("areas"):
+            centroid = area.centroid()
+            if centroid is None:
+                continue
+            cats.append(centroid.cat if centroid.cat is not None else -1)
+            wkt.append(area.to_wkt())
+    finally:
+        vmap.close()
+    return np.array(cats, dtype=np.int64), wkt
+
+
+def ReadSegments(vect, temporary=False):
+    """Return the two-vertex segments of the lines of a vector map
+
+    The segments are read from the segment store (osmcomp.store) kept in
+    the .osmcomp folder of the current mapset, memory-mapped, if it matches
+    the current geometry; otherwise they are built from ReadLines() and the
+    store is rewritten. Stores are named after the map and its stamp, so
+    the one of an older version of the map is replaced and the map's own
+    folder is never touched. Stores are not removed with their map: maps
+    that the caller removes at the end of its run (temporary) get none.
+    """
+    def Compute():
+        if temporary:
+            return Segments.FromLines(*ReadLines(vect))
+        name, stamp = MapStamp(vect)
+        env = grass.gisenv()
+        folder = os.path.join(env["GISDBASE"], env["LOCATION_NAME"], env["MAPSET"], ".osmcomp")
+        prefix = "seg_%s_" % hashlib.sha1(name.encode("utf-8")).hexdigest()[:16]
+        path = os.path.join(folder, prefix + "%s.npy" % hashlib.sha1(repr(stamp).encode("utf-8")).hexdigest()[:16])
+        if os.path.exists(path):
+            return store.Open(path)
+        seg = Segments.FromLines(*ReadLines(vect))
+        try:
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            for old in os.listdir(folder):
+                if old.startswith(prefix) and old.endswith(".npy"):
+                    os.remove(os.path.join(folder, old))
+            store.Save(path, seg)
+        except (IOError, OSError):
+            # e.g. a read-only mapset
+            pass
+        return seg
+    return _Memo(vect, "segments", Compute)
+
+
+def LineLengths(vect):
+    """Return the length of every line of a vector map (see ReadLines)"""
+    def Compute():
+        cats, offsets, xy = ReadLines(vect)
+        if xy.shape[0] == 0:
+            return np.zeros(0)
+        step = np.hypot(*np.diff(xy, axis=0).T)
+        # drop the steps joining the last vertex of a line to the next line
+        step[offsets[1:] - 1] = 0
+        cum = np.concatenate(([0.0], np.cumsum(step)))
+        end = np.append(offsets[1:], xy.shape[0]) - 1
+        return cum[np.maximum(end, offsets)] - cum[offsets]
+    return _Memo(vect, "lengths", Compute)
+
+
+def Length(vect):
+    """Return the total length of the lines of a vector map
+
+    In latitude-longitude locations geodesic lengths are computed by
+    v.to.db, otherwise the planimetric length comes from LineLengths().
+    """
+    if grass.locn_is_latlong():
+        def Compute():
+            data = grass.read_command("v.to.db", map=vect, option="length", type="line", flags="p", quiet=True)
+            return sum(float(item.split("|")[1]) for item in data.split("\n")[1:] if "|" in item)
+        return _Memo(vect, "geodesic", Compute)
+    return float(LineLengths(vect).sum())
+
+
+def WriteLines(vect, cats, offsets, xy):
+    """Write lines (as returned by ReadLines) with their categories into a new vector map"""
+    ends = np.append(offsets, xy.shape[0])
+    # lines without category (-1) are written without one
+    text = "".join("L  %d %d\n%s%s" % (e - o, c >= 0, "".join(" %.10f %.10f\n" % tuple(v) for v in xy[o:e]),
+                                        " 1 %d\n" % c if c >= 0 else "")
+                   for (c, o, e) in zip(cats, offsets, ends[1:]) if e - o > 1)
+    if not text:
+        grass.run_command("v.edit", map=vect, tool="create", quiet=True)
+        return
+    grass.write_command("v.in.ascii", input="-", output=vect, format="standard", flags="n", stdin=text, quiet=True)
+
+
+def WriteSegments(vect, seg):
+    """Write segments as two-vertex lines with their categories into a new vector map"""
+    if len(seg) == 0:
+        grass.run_command("v.edit", map=vect, tool="create", quiet=True)
+        return
+    text = "".join("L  2 1\n %.10f %.10f\n %.10f %.10f\n 1 %d\n" % row
+                   for row in zip(seg.x0, seg.y0, seg.x1, seg.y1, seg.cat))
+    grass.write_command("v.in.ascii", input="-", output=vect, format="standard", flags="n", stdin=text, quiet=True)
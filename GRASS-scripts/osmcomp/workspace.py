@@ -0,0 +1,116 @@
+"""
+Comparison workspace shared by the v.osm.* modules
+
+A workspace is a .npz file collecting what the modules compute on their
+input maps: total lengths, split segments and the length of one network
+within given distances of the other. Entries are keyed by the content hash of
+the maps (vectio.ContentHash), so the first module run on an OSM/REF pair
+fills the workspace and the following ones (even on maps renamed or copied
+meanwhile) read from it; data of changed maps are simply not found. The
+spatial index is not stored: rebuilding it from the segments is faster
+than loading it.
+"""
+import json
+import os
+
+import numpy as np
+
+from . import distance, vectio
+from .segments import Segments
+
+
+class Workspace(object):
+    """Workspace in the file path; without a path everything is computed"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.enabled = bool(path)
+        self.meta = {}
+        self.npz = None
+        self.new = {}
+        self.changed = False
+        if self.enabled and os.path.exists(path):
+            self.npz = np.load(path)
+            self.meta = json.loads(str(self.npz["meta"]))
+
+    def _Has(self, name):
+        return name in self.new or (self.npz is not None and name in self.npz.files)
+
+    def _Get(self, name):
+        if name in self.new:
+            return self.new[name]
+        return self.npz[name]
+
+    def Length(self, vect):
+        """Return the total length of a map (see vectio.Length)"""
+        if not self.enabled:
+            return vectio.Length(vect)
+        key = "length_%s" % vectio.ContentHash(vect)
+        if key not in self.meta:
+            self.meta[key] = vectio.Length(vect)
+            self.changed = True
+        return self.meta[key]
+
+    def Segments(self, vect, temporary=False):
+        """Return the split segments of a map (see vectio.ReadSegments)"""
+        if not self.enabled:
+            return vectio.ReadSegments(vect, temporary)
+        prefix = "seg_%s_" % vectio.ContentHash(vect)
+        if self._Has(prefix + "cat"):
+            return Segments.FromArrays(dict((name[len(prefix):], self._Get(name))
+                                            for name in self._Names(prefix)))
+        seg = vectio.ReadSegments(vect, temporary)
+        self.new.update(seg.Arrays(prefix))
+        self.changed = True
+        return seg
+
+    def _Names(self, prefix):
+        names = set(self.new)
+        if self.npz is not None:
+            names.update(self.npz.files)
+        return [name for name in names if name.startswith(prefix)]
+
+    def Curve(self, vect, other, step, values, temporary=False):
+        """Return the length of vect within every distance of values from other
+
+        See distance.LengthCurve(). Only the curve is stored, by step and
+        distance: the stored points are reused and the missing ones
+        computed. temporary tells that both maps are removed by the caller
+        (see vectio.ReadSegments).
+        """
+        values = [float(v) for v in values]
+        key = "curve_%s_%s" % (vectio.ContentHash(vect), vectio.ContentHash(other)) if self.enabled else None
+        known = {}
+        if key is not None and key in self.meta and self.meta[key]["step"] == step:
+            known = dict((v, l) for (v, l) in self.meta[key]["within"])
+        todo = sorted(set(v for v in values if v not in known))
+        if todo:
+            within = distance.LengthCurve(self.Segments(vect, temporary), self.Segments(other, temporary), todo, step)
+            known.update(zip(todo, within.tolist()))
+            if key is not None:
+                self.meta[key] = {"step": step, "within": sorted(known.items())}
+                self.changed = True
+        return np.array([known[v] for v in values])
+
+    def Save(self):
+        """Write the workspace if anything was added"""
+        if not self.changed:
+            return
+        arrays = {}
+        if self.npz is not None:
+            for name in self.npz.files:
+                if name != "meta" and name not in self.new:
+                    arrays[name] = self.npz[name]
+            self.npz.close()
+        arrays.update(self.new)
+        arrays["meta"] = np.array(json.dumps(self.meta, sort_keys=True))
+        tmp = "%s.%d.tmp" % (self.path, os.getpid())
+        fil = open(tmp, "wb")
+        try:
+            np.savez(fil, **arrays)
+        finally:
+            fil.close()
+        os.rename(tmp, self.path)
+        self.npz = np.load(self.path)
+        self.new = {}
+        self.changed = False
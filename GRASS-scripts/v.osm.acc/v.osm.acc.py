@@ -71,7 +71,8 @@
 #% key: perc
 #% type: double
 #% guisection: Deviation analysis
-#% description: Length percentage of OSM dataset to be considered for automated accuracy evaluation (%)
+#% description: Length percentages of OSM dataset to be considered for automated accuracy evaluation, separated by comma (%); with more values a TOL_<perc> column is written for each
+#% multiple: yes
 #% required: no
 #% answer: 100
 #%end
@@ -82,11 +83,79 @@
 #% description: Threshold values for accuracy evaluation, separated by comma (map units)
 #% required: no
 #%end
+#%option
+#% key: nprocs
+#% type: integer
+#% description: Number of processes used to evaluate the grid boxes
+#% required: no
+#% answer: 1
+#%end
+#%option G_OPT_V_INPUT
+#% key: previous
+#% guisection: Grid
+#% label: Output map of a previous run on the same grid, whose values are copied for the unchanged boxes
+#% required: no
+#%end
+#%option
+#% key: cache
+#% type: string
+#% description: Folder for the cache of buffers and lengths shared between runs and modules
+#% required: no
+#%end
+#%option
+#% key: cache_size
+#% type: double
+#% description: Maximum size of the cache (MB)
+#% required: no
+#% answer: 1024
+#%end
+#%option
+#% key: workspace
+#% type: string
+#% description: Workspace file (.npz) with the lengths, segments and distances of the input maps, created if missing
+#% required: no
+#%end
+#%option G_OPT_F_OUTPUT
+#% key: profile
+#% description: Name for JSON file with per-stage timing and GRASS command counts (no profiling if omitted)
+#% required: no
+#%end
+#%flag
+#% key: d
+#% guisection: Deviation analysis
+#% description: Compute TOL from a single distance pass per box instead of bisection
+#%end
+#%flag
+#% key: g
+#% guisection: Grid
+#% description: Clip the lines to the grid boxes in process (TOL as with -d; a grid map needs shapely >= 2.0)
+#%end
+#%flag
+#% key: f
+#% guisection: Grid
+#% description: Store box fingerprints (FPRINT column), so that the output can be the previous map of a later run
+#%end
 
 import sys
+import hashlib
+import itertools
 import math
+import multiprocessing
+import os
 import time
 import grass.script as grass
+from grass.script.utils import get_lib_path
+
+## Shared library (installed in $GISBASE/etc/v.osm, or next to the module folders)
+sys.path[:0] = [p for p in (get_lib_path(modname="v.osm"), os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")) if p]
+import osmcomp
+osmcomp.Require(grass)
+
+import numpy
+from osmcomp import distance, engine, fingerprint, gridclip, timing, vectio
+from osmcomp.cache import Cache
+from osmcomp.workspace import Workspace
+from osmcomp.segments import Segments
 
 def GetList(vect):
     list_vect = grass.read_command("v.db.select",map=vect,columns="cat",flags="c",quiet=True)
@@ -98,48 +167,243 @@ def MakeGrid(n,w,s,e,nsres,ewres,out):
     cols = math.ceil(float((e-w)/ewres))   
     grass.run_command("g.region",n=n,s=n-nsres*rows,e=w+ewres*cols,w=w,quiet=True)    
     grass.run_command("v.mkgrid",map=out,grid="%s,%s"%(rows,cols),quiet=True)
+    return int(rows),int(cols)
 
 def GetRefBox(ref,ref_box,k_box,processid):    
-    N = grass.region()['n']
-    S = grass.region()['s']
-    E = grass.region()['e']
-    W = grass.region()['w']
-    grass.run_command("g.region",vect=k_box,quiet=True)
-    ns_ext = (math.ceil(grass.region()['n']-grass.region()['s']))*10/100
-    ew_ext = (math.ceil(grass.region()['e']-grass.region()['w']))*10/100
-    grass.run_command("g.region",n=grass.region()['n']+ns_ext/2,s=grass.region()['s']-ns_ext/2,w=grass.region()['w']-ew_ext/2,e=grass.region()['e']+ew_ext/2,quiet=True)
-    grass.run_command("v.in.region",output="new_box_%s"%processid,quiet=True)
-    grass.run_command("v.overlay",ainput=ref,atype="line",binput="new_box_%s"%processid,btype="area",operator="and",output=ref_box,quiet=True)
+    ## Work on a private region (GRASS_REGION) so that boxes can be processed concurrently
+    box = grass.vector_info(k_box)
+    ns_ext = (math.ceil(box['north']-box['south']))*10/100
+    ew_ext = (math.ceil(box['east']-box['west']))*10/100
+    env = os.environ.copy()
+    env["GRASS_REGION"] = grass.region_env(n=box['north']+ns_ext/2,s=box['south']-ns_ext/2,w=box['west']-ew_ext/2,e=box['east']+ew_ext/2)
+    grass.run_command("v.in.region",output="new_box_%s"%processid,env=env,quiet=True)
+    grass.run_command("v.overlay",ainput=ref,atype="line",binput="new_box_%s"%processid,btype="area",operator="and",output=ref_box,flags="t",quiet=True)
     grass.run_command("g.remove",type="vect", name="new_box_%s"%processid,flags="f",quiet=True)
-    grass.run_command("g.region",n=N,s=S,e=E,w=W,quiet=True)
     
-def AddCol(vect,t):
+def GetColumns(vect):
     list_c = []
     list_col = ((grass.read_command("db.describe",table=vect,flags="c",quiet=True)).split("\n"))[2:-1]
     for c in list_col:
         list_c.append((c.split(":")[1]).lstrip())
-    if not "%s"%t in list_c:
-        grass.run_command("v.db.addcolumn",map=vect,columns="%s double"%t,quiet=True)
+    return list_c
+
+def AddCol(vect,t,ctype="double"):
+    if not "%s"%t in GetColumns(vect):
+        grass.run_command("v.db.addcolumn",map=vect,columns="%s %s"%(t,ctype),quiet=True)
+
+def GetBoxes(vect):
+    ## Category and bounding box (n,s,e,w) of every box
+    list_bbox = grass.read_command("v.to.db",map=vect,option="bbox",flags="p",quiet=True).split("\n")[1:]
+    return numpy.array([item.split("|") for item in list_bbox if "|" in item],dtype=float).reshape(-1,5)
+
+def RefBoxes(n,s,e,w):
+    ## Boxes enlarged as in GetRefBox (w,s,e,n)
+    ns_ext = numpy.ceil(n-s)*10/100
+    ew_ext = numpy.ceil(e-w)*10/100
+    return w-ew_ext/2,s-ns_ext/2,e+ew_ext/2,n+ns_ext/2
+
+def GetFingerprints(vect,osm,ref,params,ws):
+    ## Fingerprint of the OSM data in every box and of the REF data in the box enlarged as in GetRefBox
+    bbox = GetBoxes(vect)
+    (cats,n,s,e,w) = bbox.T
+    osm_hash = fingerprint.BoxHashes(ws.Segments(osm),w,s,e,n)
+    ref_hash = fingerprint.BoxHashes(ws.Segments(ref),*RefBoxes(n,s,e,w))
+    fprint = {}
+    for (k,box,o,r) in zip(cats,bbox[:,1:],osm_hash,ref_hash):
+        fprint[str(int(k))] = hashlib.sha1(("%s|%r|%s|%s"%(params,tuple(box),o,r)).encode("utf-8")).hexdigest()
+    return fprint
+
+def GetPrevious(vect,columns):
+    ## Values of a previous run by box category (empty if they cannot be reused)
+    list_c = GetColumns(vect)
+    if not "FPRINT" in list_c or [c for c in columns if not c in list_c]:
+        grass.warning(_("Vector map <%s> has no fingerprints or different columns: all the boxes will be evaluated") % vect)
+        return {}
+    list_prev = grass.read_command("v.db.select",map=vect,columns=",".join(["cat","FPRINT"]+columns),flags="c",quiet=True).split("\n")[0:-1]
+    prev = {}
+    for item in list_prev:
+        values = item.split("|")
+        res = {"FPRINT":values[1]}
+        for (col,val) in zip(columns,values[2:]):
+            if len(val)>0:
+                res[col] = float(val)
+        prev[values[0]] = res
+    return prev
         
-def length(data):
-    feat_data = int(((grass.read_command("v.info", map=data,flags="t")).split("\n")[2]).split("=")[1])
-    if feat_data>0:
-        length_data = grass.read_command("v.to.db",map=data,option="length",flags="p")
-        s_data=0 
-        l_data = length_data.split("\n")
-        for item in l_data[1:-1]:
-            s_data+=float(item.split("|")[1])         
+def CalcTol(data1,data2,value,processid,cache):
+    ## Length of data2 in the buffer around data1 (cached by map contents)
+    def Compute(buf_key=None):
+        vectio.CachedMap(cache,buf_key,"data1_buf_"+processid,lambda: grass.run_command("v.buffer",input=data1,output="data1_buf_"+processid,distance=value,quiet=True))
+        grass.run_command("v.overlay",ainput=data2,binput="data1_buf_"+processid,atype="line",btype="area",operator="and",output="data2_in_"+processid,flags="t",quiet=True)
+        val = vectio.Length("data2_in_"+processid)
+        vectio.Forget("data2_in_"+processid)
+        grass.run_command("g.remove",type="vect", pattern=processid,flags="fr",quiet=True)
+        return val
+    ## The keys hash the maps: only computed when there is a cache
+    if not cache.enabled:
+        return Compute()
+    buf_key = cache.Key("v.buffer",vectio.ContentHash(data1),float(value))
+    key = cache.Key("v.overlay","and",vectio.ContentHash(data2),buf_key)
+    return cache.Value(key,lambda: Compute(buf_key))
+
+def GetTol(ref_box,osm_box,l_osm,tol_max,acc,processid,cache,known=None):
+    ## known collects the lengths computed by the bisections of the same box (by distance):
+    ## they narrow the starting interval and are not computed again
+    if known is None:
+        known = {}
+    def Eval(value):
+        if not value in known:
+            known[value] = CalcTol(ref_box,osm_box,value,processid,cache)
+        return known[value]
+    x = 0
+    val = 0
+    UP = tol_max
+    DOWN = 0.0    
+    up = min([tol_max]+[d for d in known if known[d] >= l_osm and d < tol_max])
+    down = max([0.0]+[d for d in known if known[d] < l_osm and d < up])
+    mid = down + (up-down)/2
+    exit = 0      
+    while exit==0:
+        val = Eval(mid)
+
+        if val >= l_osm: # all in
+            new_mid = down + (mid-down)/2
+            up = mid
+            mid = new_mid                     
+
+        elif val < l_osm: # not all in 
+
+            if not down < mid + acc < up:
+                if up!=UP:
+                    x = up
+                    exit = 1
+                else:
+                    exit = 2
+            else:
+                val = Eval(mid + acc)
+
+            if val >= l_osm:  # all in (considering epsilon)
+                x = mid + acc
+                exit = 1
+            elif val < l_osm:  # not all in (considering epsilon)
+                new_mid =(mid+acc) + (up-(mid+acc))/2
+                down = mid + acc
+                mid = new_mid                                                    
+    if exit == 1:
+        return x
+    return None
+
+def GetTolDist(ref_box,osm_box,list_perc,tol_max,acc):
+    ## All the percentages from the same distance pass
+    osm_seg = Segments.FromLines(*vectio.ReadLines(osm_box))
+    ref_seg = Segments.FromLines(*vectio.ReadLines(ref_box))
+    x = distance.CoverDistance(osm_seg,ref_seg,[float(p)/100.0 for p in list_perc],tol_max,acc)
+    return [None if math.isnan(v) else v for v in x]
+
+def TolColumns(list_perc):
+    ## A single percentage keeps the TOL column
+    if len(list_perc)==1:
+        return ["TOL"]
+    return distance.Percentages(list_perc)[1]
+
+def WriteResults(vect,list_res,chunk=5000):
+    ## Write box values as SQL statements, one db.execute transaction per chunk of boxes
+    db = grass.vector_db(vect)[1]
+    sql = []
+    for (k,res) in list_res:
+        if len(res)>0:
+            values = ",".join(["%s='%s'"%(col,res[col]) if col=="FPRINT" else "%s=%r"%(col,float(res[col])) for col in sorted(res)])
+            sql.append("UPDATE %s SET %s WHERE %s=%s;\n"%(db["table"],values,db["key"],k))
+        if len(sql)==chunk:
+            grass.write_command("db.execute",input="-",database=db["database"],driver=db["driver"],stdin="".join(sql),quiet=True)
+            sql = []
+    if len(sql)>0:
+        grass.write_command("db.execute",input="-",database=db["database"],driver=db["driver"],stdin="".join(sql),quiet=True)
+
+def AddFingerprint(list_res,fprint):
+    for (k,res) in list_res:
+        res["FPRINT"] = fprint[k]
+        yield (k,res)
+
+def EvalBox(task):
+    (k,osm,ref,output,list_tol,tol_max,list_perc,dist,processid,cache) = task
+    ## Temporary names of this box (the trailing "x" keeps e.g. box 1 from matching box 10)
+    boxid = "%s_c%sx"%(processid,k)
+    tolid = boxid+"_tol"
+    k_box = "k_box_"+boxid
+    osm_box = "osm_box_"+boxid
+    ref_box = "ref_box_"+boxid
+    res = {}
+
+    grass.run_command("v.extract",input=output,output=k_box,where="cat=%s"%k,flags="t",quiet=True)
+    grass.run_command("v.overlay",ainput=osm,atype="line",binput=k_box,btype="area",operator="and",output=osm_box,flags="t",quiet=True)
+    real_l_osm = vectio.Length(osm_box)
+    res["OSM"] = real_l_osm
+
+    if len(list_tol)>0:
+        grass.run_command("v.overlay",ainput=ref,atype="line",binput=k_box,btype="area",operator="and",output=ref_box,flags="t",quiet=True)
+        feat_ref_box = int(((grass.read_command("v.info", map=ref_box,flags="t")).split("\n")[2]).split("=")[1])
+        if feat_ref_box>0:
+            for item in list_tol:
+                val = CalcTol(ref_box,osm_box,float(item),tolid,cache)
+                res["t_%s"%item] = val
+                res["p_%s"%item] = val*100.0/real_l_osm
     else:
-        s_data=0
-    return s_data
-   
-def CalcTol(data1,data2,value):
-    processid = str(time.time()).replace(".","_")
-    grass.run_command("v.buffer",input=data1,output="data1_buf_"+processid,distance=value,quiet=True)
-    grass.run_command("v.overlay",ainput=data2,binput="data1_buf_"+processid,atype="line",btype="area",operator="and",output="data2_in_"+processid,quiet=True)
-    val = length("data2_in_"+processid)
-    grass.run_command("g.remove",type="vect", pattern=processid,flags="fr",quiet=True)
-    return val
+        acc = 0.005
+        # Get REF_BOX data in slightly bigger box
+        GetRefBox(ref,ref_box,k_box,boxid)
+        if vectio.Length(ref_box)>0:
+            if dist:
+                list_x = GetTolDist(ref_box,osm_box,list_perc,float(tol_max),acc)
+            else:
+                ## Highest percentage first: its bisection bounds the following ones
+                known = {}
+                list_x = [None]*len(list_perc)
+                for i in sorted(range(len(list_perc)),key=lambda i: -float(list_perc[i])):
+                    if float(list_perc[i]) == 100.0:
+                        l_osm = real_l_osm
+                    else:
+                        l_osm = real_l_osm*float(list_perc[i])/100.0
+                    list_x[i] = GetTol(ref_box,osm_box,l_osm,float(tol_max),acc,tolid,cache,known)
+            for (col,x) in zip(TolColumns(list_perc),list_x):
+                if x is not None:
+                    res[col] = (math.ceil(x*100))/100
+
+    vectio.Forget(osm_box)
+    vectio.Forget(ref_box)
+    grass.run_command("g.remove",type="vect",pattern=boxid,flags="fr",quiet=True)
+    return (k,res)
+
+def EvalGrid(list_box,cats,osm_box,osm_pieces,ref_box,ref_pieces,list_tol,tol_max,list_perc):
+    ## Evaluate the boxes from the lines clipped to the grid (-g): pieces are given by box index,
+    ## the REF ones clipped to the boxes (tol_eval) or to the boxes enlarged as in GetRefBox (TOL)
+    nbox = len(cats)
+    pos = dict((str(int(k)),i) for (i,k) in enumerate(cats))
+    idx = numpy.array([pos[k] for k in list_box],dtype=int)
+    l_osm = gridclip.BoxLength(osm_box,osm_pieces,nbox)
+    l_ref = gridclip.BoxLength(ref_box,ref_pieces,nbox)
+    if len(list_tol)>0:
+        sel = numpy.isin(osm_box,idx)
+        list_val = [numpy.bincount(osm_box[sel],engine.CoveredLength(osm_pieces.Take(sel),ref_pieces,float(item),osm_box[sel],ref_box),nbox) for item in list_tol]
+    else:
+        acc = 0.005
+        (osm_order,osm_cut) = gridclip.ByBox(osm_box,nbox)
+        (ref_order,ref_cut) = gridclip.ByBox(ref_box,nbox)
+    for (k,i) in zip(list_box,idx):
+        res = {"OSM":l_osm[i]}
+        if len(list_tol)>0:
+            if l_ref[i]>0:
+                for (item,val) in zip(list_tol,list_val):
+                    res["t_%s"%item] = val[i]
+                    res["p_%s"%item] = val[i]*100.0/l_osm[i]
+        elif l_ref[i]>0:
+            osm_seg = osm_pieces.Take(osm_order[osm_cut[i]:osm_cut[i+1]])
+            ref_seg = ref_pieces.Take(ref_order[ref_cut[i]:ref_cut[i+1]])
+            list_x = distance.CoverDistance(osm_seg,ref_seg,[float(p)/100.0 for p in list_perc],float(tol_max),acc)
+            for (col,x) in zip(TolColumns(list_perc),list_x):
+                if not math.isnan(x):
+                    res[col] = (math.ceil(x*100))/100
+        yield (k,res)
 
 def main():
     osm = options["osm"]
@@ -149,10 +413,17 @@ def main():
     lr_grid = options["lr_grid"]
     box_grid = options["box_grid"]
     output = options["output"]
+    previous = options["previous"]
     tol_eval = options["tol_eval"]
     tol_max = options["tol_max"]
-    perc = float(options["perc"])
+    ## Percentages as numbers: repeated values (95,95.0) would give the same column twice
+    list_perc = distance.Percentages(options["perc"].split(","))[0]
+    nprocs = int(options["nprocs"])
+    cache = Cache(options["cache"],options["cache_size"])
+    ws = Workspace(options["workspace"])
 
+    prof = timing.Profiler("v.osm.acc",options["profile"])
+    prof.Install(grass)
     
 
     ## Check if input files exist
@@ -169,9 +440,19 @@ def main():
         if not grass.find_file(name=grid,element='vector')['file']:
             grass.fatal(_("Vector map <%s> not found") % grid)
 
+    if len(previous)>0:
+        if not grass.find_file(name=previous,element='vector')['file']:
+            grass.fatal(_("Vector map <%s> not found") % previous)
+
+    # Prepare temporary map names
+    processid = str(time.time()).replace(".","_")  
+    tmp_output = "tmp_out_"+processid
+    made_grid = False
+
     # Check length OSM and REF
-    check_ref = length(ref)
-    check_osm = length(osm)
+    prof.Stage("length")
+    check_ref = ws.Length(ref)
+    check_osm = ws.Length(osm)
 
     if check_ref == 0:
         grass.run_command("g.remove", type="vect", pattern="%s"%processid,flags="fr",quiet=True)
@@ -200,118 +481,133 @@ def main():
         
     if (len(grid)==0 and len(ul_grid)==0 and len(lr_grid)==0 and len(box_grid)==0 and len(output)==0):
         grass.fatal("No grid specified. The accuracy will be calculated on the whole current region. Please specify the name for the grid output vector map")
+
+    if flags["g"] and len(grid)==0 and len(ul_grid)==0:
+        grass.fatal(_("The -g flag requires a <grid> map or <ul_grid>, <lr_grid> and <box_grid>"))
+
+    ## Distances computed in process are planar (v.buffer is used otherwise)
+    if (flags["g"] or (flags["d"] and len(str(tol_max))>0)) and grass.locn_is_latlong():
+        grass.fatal(_("The -d and -g flags require a projected location"))
         
 
-    # Prepare temporary map raster names
-    processid = str(time.time()).replace(".","_")  
-    k_box = "k_box_"+processid
-    osm_box = "osm_box_"+processid
-    ref_box = "ref_box_"+processid
-    tmp_output = "tmp_out_"+processid
+    try:
+        # Get or create grid #    
+        prof.Stage("grid")
+        if (len(grid)>0):
+            tmp_output = grid
+            grass.run_command("g.region",vect=grid,quiet=True) 
+        if (len(grid)==0 and len(ul_grid)>0 and len(lr_grid)>0 and len(box_grid)>0 and len(output)>0):
+            n = float(ul_grid.split(",")[0])
+            w = float(ul_grid.split(",")[1])
+            s = float(lr_grid.split(",")[0])
+            e = float(lr_grid.split(",")[1])
+            nsres = float(box_grid.split(",")[1])
+            ewres = float(box_grid.split(",")[0])    
+            (rows,cols) = MakeGrid(n,w,s,e,nsres,ewres,tmp_output)
+            made_grid = True
+        if (len(grid)==0 and len(ul_grid)==0 and len(lr_grid)==0 and len(box_grid)==0 and len(output)>0):
+            grass.run_command("g.region",vect=ref,quiet=True)
+            grass.run_command("v.in.region",output=output,quiet=True)  
+            grass.run_command("v.db.addtable", map=output,quiet=True) 
     
-    # Get or create grid #    
-    if (len(grid)>0):
-        tmp_output = grid
-        grass.run_command("g.region",vect=grid,quiet=True) 
-    if (len(grid)==0 and len(ul_grid)>0 and len(lr_grid)>0 and len(box_grid)>0 and len(output)>0):
-        n = float(ul_grid.split(",")[0])
-        w = float(ul_grid.split(",")[1])
-        s = float(lr_grid.split(",")[0])
-        e = float(lr_grid.split(",")[1])
-        nsres = float(box_grid.split(",")[1])
-        ewres = float(box_grid.split(",")[0])    
-        MakeGrid(n,w,s,e,nsres,ewres,tmp_output)        
-    if (len(grid)==0 and len(ul_grid)==0 and len(lr_grid)==0 and len(box_grid)==0 and len(output)>0):
-        grass.run_command("g.region",vect=ref,quiet=True)
-        grass.run_command("v.in.region",output=output,quiet=True)  
-        grass.run_command("v.db.addtable", map=output,quiet=True) 
-    
-    # Extract box id with where OSM data exists
-    if not (len(grid)==0 and len(ul_grid)==0 and len(lr_grid)==0 and len(box_grid)==0 and len(output)>0):
-        grass.run_command("v.select",ainput=tmp_output,binput=osm,operator="overlap",output=output,quiet=True)
-        list_box = GetList(output)
+        # Extract box id with where OSM data exists
+        prof.Stage("select")
+        if flags["g"]:
+            bbox = GetBoxes(tmp_output)
+            cats = bbox[:,0]
+            pos = dict((int(k),i) for (i,k) in enumerate(cats))
+            if len(grid)>0:
+                ## Any polygons: STR-tree of the areas, lines clipped in batches
+                (area_cats,areas) = vectio.ReadAreas(grid)
+                box_of_cell = numpy.array([pos.get(int(k),-1) for k in area_cats],dtype=int)
+                def ClipLines(seg):
+                    (area,pieces) = gridclip.ClipToPolygons(seg,areas)
+                    box = box_of_cell[area]
+                    return box[box>=0],pieces.Take(box>=0)
+            else:
+                ## Cut the lines at the grid lines: box of a piece by index arithmetic
+                cell = numpy.round((n-bbox[:,1])/nsres).astype(int)*cols + numpy.round((bbox[:,4]-w)/ewres).astype(int)
+                box_of_cell = numpy.full(rows*cols,-1,dtype=int)
+                box_of_cell[cell] = numpy.arange(len(cats))
+                def ClipLines(seg):
+                    (cell,pieces) = gridclip.ClipToGrid(seg,w,n,ewres,nsres,rows,cols)
+                    return box_of_cell[cell],pieces
+            try:
+                (osm_box,osm_pieces) = ClipLines(ws.Segments(osm))
+            except ImportError as e:
+                grass.fatal(_("Unable to clip to the grid areas: %s") % e)
+            l_box = gridclip.BoxLength(osm_box,osm_pieces,len(cats))
+            list_box = [str(int(k)) for k in cats[l_box>0]]
+            if len(list_box)==0:
+                grass.fatal(_("No OSM data in the grid boxes"))
+            catfile = grass.tempfile()
+            with open(catfile,"w") as fil:
+                fil.write("\n".join(list_box)+"\n")
+            grass.run_command("v.extract",input=tmp_output,output=output,file=catfile,quiet=True)
+            os.remove(catfile)
+        elif not (len(grid)==0 and len(ul_grid)==0 and len(lr_grid)==0 and len(box_grid)==0 and len(output)>0):
+            grass.run_command("v.select",ainput=tmp_output,binput=osm,operator="overlap",output=output,quiet=True)
+            list_box = GetList(output)
     
-    # Get tolerance values and evaluate #       
-    if len(tol_eval)>0:
-        list_tol = tol_eval.split(",")
-        AddCol(output,"OSM")
-        for item in list_tol:
-            AddCol(output,"t_%s"%item)
-            AddCol(output,"p_%s"%item)
-        
-        for k in list_box:
-            grass.run_command("v.extract",input=output,output=k_box,where="cat=%s"%k,quiet=True)
-            grass.run_command("v.overlay",ainput=osm,atype="line",binput=k_box,btype="area",operator="and",output=osm_box,quiet=True)
-	    l_osm = length(osm_box)
-            grass.run_command("v.db.update",map=output,column="OSM",value=l_osm,where="cat=%s"%k,quiet=True)   
-            grass.run_command("v.overlay",ainput=ref,atype="line",binput=k_box,btype="area",operator="and",output=ref_box,quiet=True)
-	    feat_ref_box = int(((grass.read_command("v.info", map=ref_box,flags="t")).split("\n")[2]).split("=")[1])
-            if feat_ref_box>0:
-                for item in list_tol:
-                    val = CalcTol(ref_box,osm_box,float(item))
-                    grass.run_command("v.db.update",map=output,column="t_%s"%item,value=val,where="cat=%s"%k,quiet=True) 
-                    grass.run_command("v.db.update",map=output,column="p_%s"%item,value=val*100.0/l_osm,where="cat=%s"%k,quiet=True) 
-            grass.run_command("g.remove",type="vect", pattern=processid,flags="fr",quiet=True)
-                
-
-    # Automated evaluation #    
-    if len(str(tol_max))>0:
-        acc = 0.005
-        AddCol(output,"OSM")
-        AddCol(output,"TOL")
-       
-        for k in list_box:
-            grass.run_command("v.extract",input=output,output=k_box,where="cat=%s"%k,quiet=True)
-            grass.run_command("v.overlay",ainput=osm,atype="line",binput=k_box,btype="area",operator="and",output=osm_box,quiet=True)
-            real_l_osm = length(osm_box)
-            if perc == 100.0:
-                l_osm = real_l_osm
+        # Get tolerance values and evaluate #       
+        if len(tol_eval)>0:
+            list_tol = tol_eval.split(",")
+            list_col = ["OSM"]
+            for item in list_tol:
+                list_col += ["t_%s"%item,"p_%s"%item]
+
+        # Automated evaluation #    
+        if len(str(tol_max))>0:
+            list_tol = []
+            list_col = ["OSM"]+TolColumns(list_perc)
+
+        for col in list_col:
+            AddCol(output,col)
+        # Fingerprint the boxes (only to compare or store them) and copy the values of the unchanged ones #
+        fingerprints = len(previous)>0 or flags["f"]
+        list_copy = []
+        if fingerprints:
+            prof.Stage("fingerprint")
+            AddCol(output,"FPRINT","varchar(40)")
+            fprint = GetFingerprints(output,osm,ref,"%s|%s|%s|%s|%s"%(tol_eval,tol_max,",".join([str(float(p)) for p in list_perc]),flags["d"],flags["g"]),ws)
+        if len(previous)>0:
+            prev = GetPrevious(previous,list_col)
+            list_copy = [(k,prev[k]) for k in list_box if k in prev and prev[k]["FPRINT"]==fprint[k]]
+            done = set([k for (k,res) in list_copy])
+            list_box = [k for k in list_box if not k in done]
+            grass.message(_("%d boxes unchanged, %d to be evaluated") % (len(list_copy),len(list_box)))
+
+        # Evaluate boxes, in parallel if required #
+        prof.Stage("boxes",len(list_box))
+        list_task = [(k,osm,ref,output,list_tol,tol_max,list_perc,flags["d"],processid,cache) for k in list_box]
+        if flags["g"]:
+            if len(list_tol)>0:
+                (ref_box,ref_pieces) = ClipLines(ws.Segments(ref))
             else:
-                l_osm = real_l_osm*float(perc)/100.0
-
-            grass.run_command("v.db.update",map=output,column="OSM",value=real_l_osm,where="cat=%s"%k,quiet=True)   
-            # Get REF_BOX data in slightly bigger box
-            GetRefBox(ref,ref_box,k_box,processid)
-	    if length(ref_box)>0:
-                x = 0
-                val = 0
-                UP = float(tol_max)
-                DOWN = 0.0    
-                up = float(tol_max)
-                down = 0.0
-                mid = down + (up-down)/2
-                exit = 0      
-                while exit==0:
-                    val = CalcTol(ref_box,osm_box,mid)
-                    
-                    if val >= l_osm: # all in
-                        new_mid = down + (mid-down)/2
-                        up = mid
-                        mid = new_mid                     
-                                       
-                    elif val < l_osm: # not all in 
-                        
-                        if not down < mid + acc < up:
-                            if up!=UP:
-                                x = up
-                                exit = 1
-                            else:
-                                exit = 2
-                        else:
-                            val = CalcTol(ref_box,osm_box,mid + acc)
-                        
-                        if val >= l_osm:  # all in (considering epsilon)
-                            x = mid + acc
-                            exit = 1
-                        elif val < l_osm:  # not all in (considering epsilon)
-                            new_mid =(mid+acc) + (up-(mid+acc))/2
-                            down = mid + acc
-                            mid = new_mid                                                    
-                if exit == 1:
-                    grass.run_command("v.db.update",map=output,column="TOL",value=(math.ceil(x*100))/100,where="cat=%s"%k)
-                grass.run_command("g.remove",type="vect",pattern=processid,flags="fr")
-	    grass.run_command("g.remove",type="vect",pattern=processid,flags="fr")
-                        
+                (ref_box,ref_pieces) = gridclip.ClipToBoxes(ws.Segments(ref),*RefBoxes(*bbox[:,1:].T))
+            list_res = EvalGrid(list_box,cats,osm_box,osm_pieces,ref_box,ref_pieces,list_tol,tol_max,list_perc)
+        elif nprocs>1:
+            pool = multiprocessing.Pool(nprocs)
+            list_res = pool.imap_unordered(EvalBox,list_task)
+        else:
+            list_res = map(EvalBox,list_task)
+
+        if fingerprints:
+            list_res = AddFingerprint(list_res,fprint)
+        WriteResults(output,itertools.chain(list_copy,list_res))
+
+        if nprocs>1 and not flags["g"]:
+            pool.close()
+            pool.join()
+
+        cache.Evict()
+        ws.Save()
+        prof.Write()
+    finally:
+        ## The grid built by MakeGrid is only needed by this run
+        if made_grid:
+            grass.run_command("g.remove",type="vect",name=tmp_output,flags="f",quiet=True)
+
 
 if __name__ == "__main__":
     options,flags = grass.parser()
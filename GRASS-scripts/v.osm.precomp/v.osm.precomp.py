@@ -58,39 +58,136 @@
 #% required: yes
 #%end
 
+#%option
+#% key: step
+#% type: double
+#% description: Maximum length of the line pieces used by the distance pass (map units, default: smallest buffer / 10)
+#% required: no
+#%end
+
+#%option
+#% key: cache
+#% type: string
+#% description: Folder for the cache of buffers and lengths shared between runs and modules
+#% required: no
+#%end
+
+#%option
+#% key: cache_size
+#% type: double
+#% description: Maximum size of the cache (MB)
+#% required: no
+#% answer: 1024
+#%end
+
+#%option
+#% key: workspace
+#% type: string
+#% description: Workspace file (.npz) with the lengths, segments and distances of the input maps, created if missing
+#% required: no
+#%end
+
+#%option
+#% key: nprocs
+#% type: integer
+#% description: Number of processes evaluating the buffer values (each running nprocs/buffers GRASS commands concurrently)
+#% required: no
+#% answer: 1
+#%end
+
+#%option G_OPT_F_OUTPUT
+#% key: profile
+#% description: Name for JSON file with per-stage timing and GRASS command counts (no profiling if omitted)
+#% required: no
+#%end
+
+#%flag
+#% key: d
+#% description: Compute the statistics for all the buffer values from a single distance pass
+#%end
+
 import sys
 import math
-import time
+import multiprocessing
+import os
+import uuid
 import grass.script as grass
+from grass.script.utils import get_lib_path
+
+## Shared library (installed in $GISBASE/etc/v.osm, or next to the module folders)
+sys.path[:0] = [p for p in (get_lib_path(modname="v.osm"), os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")) if p]
+import osmcomp
+osmcomp.Require(grass)
+
+from osmcomp import distance, tasks, timing, vectio
+from osmcomp.cache import Cache
+from osmcomp.workspace import Workspace
+
+
+def InOut(graph,name,data,other,buff,cache,processid):
+    ## Tasks <name>_in and <name>_out: length of data in and out the buffer around other (cached by map contents)
+    ## The keys hash the maps: only computed when there is a cache
+    buf_key = key = None
+    if cache.enabled:
+        buf_key = cache.Key("v.buffer",vectio.ContentHash(other),float(buff),"line")
+        key = cache.Key("v.overlay","and,not",vectio.ContentHash(data),buf_key)
+        found = cache.Get(key)
+        if found is not None:
+            graph.Add(name+"_in",lambda: found[0])
+            graph.Add(name+"_out",lambda: found[1])
+            return
+
+    buffer = "buffer_"+processid
+    data_in = "data_in_"+processid
+    data_out = "data_out_"+processid
+    def Overlay(operator,output):
+        grass.run_command("v.overlay",ainput=data,binput=buffer,operator=operator,output=output,atype="line",flags="t",overwrite=True,quiet=True)
+        return vectio.Length(output)
+    def Done(s_in,s_out):
+        ### Remove temporary data
+        vectio.Forget(data_in)
+        vectio.Forget(data_out)
+        grass.run_command("g.remove", type="vect", pattern="%s"%processid,flags="fr",quiet=True)
+        cache.Put(key,[s_in,s_out])
+
+    ## The "and" and "not" overlays only need the buffer
+    graph.Add(name+"_buffer",lambda: vectio.CachedMap(cache,buf_key,buffer,lambda: grass.run_command("v.buffer",input=other,output=buffer,distance=buff,type="line",overwrite=True,quiet=True)))
+    graph.Add(name+"_in",lambda b: Overlay("and",data_in),[name+"_buffer"])
+    graph.Add(name+"_out",lambda b: Overlay("not",data_out),[name+"_buffer"])
+    graph.Add(name+"_done",Done,[name+"_in",name+"_out"])
 
+def TempId():
+    ## Temporary name suffix unique across processes, runs and users of the mapset
+    return "%s_%d"%(uuid.uuid4().hex,os.getpid())
 
-def GetStat(osm,ref,buff):
-    processid = str(time.time()).replace(".","_")    
-    ref_buffer="ref_buffer_"+processid
-    osm_buffer= "osm_buffer_"+processid
-    ref_in= "ref_in_"+processid
-    ref_out= "ref_out_"+processid 
-    osm_in= "osm_in_"+processid
-    osm_out= "osm_out_"+processid
+def GetStat(osm,ref,buff,cache,nprocs=1):
+    processid = TempId()
+    graph = tasks.TaskGraph(nprocs)
 
-    ## Calculate REF data in and out OSM buffer
-    grass.run_command("v.buffer",input=osm, output=osm_buffer, distance=buff, type="line",overwrite=True,quiet=True)
-    grass.run_command("v.overlay",ainput=ref,binput=osm_buffer,operator="and", output=ref_in, atype="line",flags="t",overwrite=True,quiet=True)
-    grass.run_command("v.overlay",ainput=ref,binput=osm_buffer,operator="not", output=ref_out,atype="line",flags="t",overwrite=True,quiet=True)
-    s_ref_in = length(ref_in)
-    s_ref_out = length(ref_out)          
+    ## Calculate REF data in and out OSM buffer (own temporary names: the branches run concurrently)
+    InOut(graph,"ref",ref,osm,buff,cache,processid+"_r")
 
     ## Calculate OSM data in and out REF buffer  
-    grass.run_command("v.buffer",input=ref,output=ref_buffer,distance=buff,type="line",overwrite=True,quiet=True)
-    grass.run_command("v.overlay",ainput=osm,binput=ref_buffer,operator="and", output=osm_in, atype="line",flags="t",overwrite=True,quiet=True)
-    grass.run_command("v.overlay",ainput=osm,binput=ref_buffer,operator="not",output=osm_out,atype="line",flags="t",overwrite=True,quiet=True) 
-    s_osm_in = length(osm_in)
-    s_osm_out = length(osm_out)  
+    InOut(graph,"osm",osm,ref,buff,cache,processid+"_o")
 
-    ### Remove temporary data
-    grass.run_command("g.remove", type="vect", pattern="%s"%processid,flags="fr",quiet=True)
-    
-    return (s_ref_in,s_ref_out,s_osm_in,s_osm_out)
+    try:
+        res = graph.Run()
+    finally:
+        grass.run_command("g.remove", type="vect", pattern="%s"%processid,flags="fr",quiet=True)
+    return (res["ref_in"],res["ref_out"],res["osm_in"],res["osm_out"])
+
+def EvalBuffer(task):
+    (osm,ref,b,cache,nprocs) = task
+    return GetStat(osm,ref,b,cache,nprocs)
+
+def GetCurve(osm,ref,buffers,step,ws,temporary=False):
+    ## temporary: maps removed at the end of the run (roi), which get no segment store
+    ## Length of REF within the buffers around OSM and vice versa (pieces measured chunk by chunk)
+    s_ref_in = ws.Curve(ref,osm,step,buffers,temporary)
+    s_osm_in = ws.Curve(osm,ref,step,buffers,temporary)
+    l_ref = ws.Segments(ref,temporary).Length().sum()
+    l_osm = ws.Segments(osm,temporary).Length().sum()
+    return [(r,l_ref-r,o,l_osm-o) for (r,o) in zip(s_ref_in,s_osm_in)]
 
     
 def Plot(buff, osm_in, ref_in, REF_tot, OSM_tot,out):
@@ -206,19 +303,6 @@ def Plot(buff, osm_in, ref_in, REF_tot, OSM_tot,out):
     pylab.savefig("%s/ref_out_perc.png"%out)
 
 
-def length(data):
-    feat_osm = int(((grass.read_command("v.info", map=data,flags="t",quiet=True)).split("\n")[2]).split("=")[1])
-    if feat_osm>0:
-        length_data = grass.read_command("v.to.db",map=data,option="length",flags="p")
-        s_data=0 
-        l_data = length_data.split("\n")
-        for item in l_data[1:-1]:
-            s_data+=float(item.split("|")[1])         
-    else:
-        s_data=0
-    return s_data
-
-
 def GetInfo(fileName):
     lines = [line.strip() for line in open(fileName)]
     ref_in = lines[3].split(': ')[1].split(' ')[0]
@@ -233,7 +317,13 @@ def main():
     roi = options["roi"]
     out_graphs = options["out_graphs"]
     out = options["output"]
+    step = options["step"]
+    nprocs = int(options["nprocs"])
+    cache = Cache(options["cache"],options["cache_size"])
+    ws = Workspace(options["workspace"])
 
+    prof = timing.Profiler("v.osm.precomp",options["profile"])
+    prof.Install(grass)
 
     ## Check if input files exist
     if not grass.find_file(name=osm,element='vector')['file']:
@@ -247,8 +337,9 @@ def main():
             grass.fatal(_("Vector map <%s> not found") % roi)
 
     # OSM and REF length
-    s_ref = length(ref)
-    s_osm = length(osm)
+    prof.Stage("length")
+    s_ref = ws.Length(ref)
+    s_osm = ws.Length(osm)
 
     if s_ref == 0:
         grass.run_command("g.remove", type="vect", pattern="%s"%processid,flags="fr",quiet=True)
@@ -262,12 +353,13 @@ def main():
     diff_p = diff/s_ref*100
 
     ## Temporary names 
-    processid = str(time.time()).replace(".","_")    
+    processid = TempId()
     ref_roi="ref_roi_"+processid
     osm_roi="osm_roi_"+processid
 
     ## Apply mask
     if len(roi)>0:
+        prof.Stage("roi")
         grass.run_command("v.overlay",ainput=ref, atype="line", binput=roi, operator="and", output=ref_roi,flags="t",quiet=True)
         grass.run_command("v.overlay",ainput=osm, atype="line", binput=roi, operator="and", output=osm_roi,flags="t",quiet=True)
         ref = ref_roi
@@ -286,8 +378,28 @@ def main():
     l_ref_in = []
     l_var_ref_in = []
 
-    for b in list_buff:
-        (s_ref_in,s_ref_out,s_osm_in,s_osm_out) = GetStat(osm,ref,b)
+    prof.Stage("buffers",len(list_buff))
+    if flags["d"]:
+        if grass.locn_is_latlong():
+            grass.fatal(_("The distance pass requires a projected location"))
+        if len(step)>0:
+            step = float(step)
+        else:
+            step = min([b for b in list_buff if b>0] or [1.0])/10.0
+        list_stat = GetCurve(osm,ref,list_buff,step,ws,len(roi)>0)
+    else:
+        ## Buffer values in parallel processes, statistics kept in buffer order
+        nworkers = max(min(nprocs,len(list_buff)),1)
+        list_task = [(osm,ref,b,cache,max(nprocs//nworkers,1)) for b in list_buff]
+        if nworkers>1:
+            pool = multiprocessing.Pool(nworkers)
+            list_stat = pool.map(EvalBuffer,list_task)
+            pool.close()
+            pool.join()
+        else:
+            list_stat = [EvalBuffer(task) for task in list_task]
+
+    for (s_ref_in,s_ref_out,s_osm_in,s_osm_out) in list_stat:
         l_osm_in.append(round(s_osm_in,1))
         l_var_osm_in.append(round(s_osm_in/s_osm*100,1))
         l_ref_in.append(round(s_ref_in,1))
@@ -298,6 +410,7 @@ def main():
         l_var_ref_out.append(round(s_ref_out/s_ref*100,1))
 
     ### Print statistics  
+    prof.Stage("output")
     fil = open(out,"w")
     fil.write("REF length: %s m\n"%(round(s_ref,1)))       
     fil.write("OSM length: %s m\n"%(round(s_osm,1))) 
@@ -313,7 +426,12 @@ def main():
 
     # Graphs  
     if len(out_graphs)>0:   
+        prof.Stage("plot")
         Plot(list_buff,l_osm_in,l_ref_in,s_ref,s_osm,out_graphs)
+
+    cache.Evict()
+    ws.Save()
+    prof.Write()
     
 if __name__ == "__main__":
     options,flags = grass.parser()
@@ -64,46 +64,124 @@
 #% required: no
 #%end
 
-import math
+#%option 
+#% key: tile_size
+#% type: double 
+#% description: Size of the tiles matched by the in-process engine (map units): unit of the checkpoints and of the nprocs processes; the maps stay whole in memory
+#% required: no
+#%end
+
+#%option G_OPT_F_OUTPUT
+#% key: checkpoint
+#% description: Name for the file where the state of the angular comparison is saved periodically
+#% required: no
+#%end
+
+#%option
+#% key: cache
+#% type: string
+#% description: Folder for the cache of generalized lines shared between runs and modules
+#% required: no
+#%end
+
+#%option
+#% key: cache_size
+#% type: double
+#% description: Maximum size of the cache (MB)
+#% required: no
+#% answer: 1024
+#%end
+
+#%option
+#% key: workspace
+#% type: string
+#% description: Workspace file (.npz) with the lengths, segments and distances of the input maps, created if missing
+#% required: no
+#%end
+
+#%option
+#% key: nprocs
+#% type: integer
+#% description: Number of independent GRASS commands (or tiles, see tile_size) run concurrently
+#% required: no
+#% answer: 1
+#%end
+
+#%option G_OPT_F_OUTPUT
+#% key: profile
+#% description: Name for JSON file with per-stage timing and GRASS command counts (no profiling if omitted)
+#% required: no
+#%end
+
+#%flag
+#% key: i
+#% description: Use the in-process spatial-index engine for the angular comparison
+#%end
+
+#%flag
+#% key: r
+#% description: Resume an interrupted run from the checkpoint file
+#%end
+
+#%flag
+#% key: o
+#% description: Generalize also the OSM dataset with douglas_thres
+#%end
+
+import os
 import sys
-import shutil
 import time
 import grass.script as grass
-
-def length(data):
-    feat_osm = int(((grass.read_command("v.info", map=data,flags="t",quiet=True)).split("\n")[2]).split("=")[1])
-    if feat_osm>0:
-        length_data = grass.read_command("v.to.db",map=data,option="length",flags="p")
-        s_data=0 
-        l_data = length_data.split("\n")
-        for item in l_data[1:-1]:
-            s_data+=float(item.split("|")[1])         
-    else:
-        s_data=0
-    return s_data
-
-
-def GetCoeff(vect):
-    coord_start = grass.read_command("v.to.db", map=vect, option="start", type="line",flags="p").split("\n")[1]
-    x_start = float(coord_start.split("|")[1])
-    y_start = float(coord_start.split("|")[2])
-    coord_end = grass.read_command("v.to.db", map=vect, option="end", type="line",flags="p").split("\n")[1]   
-    x_end = float(coord_end.split("|")[1])
-    y_end = float(coord_end.split("|")[2])
-    if (x_end-x_start) <> 0:
-        m = (y_end-y_start)/(x_end-x_start)
-    else:
-        m = 10**9
-    return m
+from grass.script.utils import get_lib_path
+
+## Shared library (installed in $GISBASE/etc/v.osm, or next to the module folders)
+sys.path[:0] = [p for p in (get_lib_path(modname="v.osm"), os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")) if p]
+import osmcomp
+osmcomp.Require(grass)
+
+import numpy
+from osmcomp import engine, generalize, tasks, timing, topology, vectio
+from osmcomp.cache import Cache
+from osmcomp.checkpoint import Checkpoint
+from osmcomp.workspace import Workspace
+from osmcomp.geom import AngleDiff
+from osmcomp.segments import Segments
+
+
+def Generalize(vect,thres,cache,nprocs):
+    ## Douglas-Peucker in process on the lines of vect (cached by map contents and threshold)
+    if not cache.enabled:
+        return generalize.Generalize(*vectio.ReadLines(vect),thres=float(thres),nprocs=nprocs)
+    key = cache.Key("douglas",vectio.ContentHash(vect),float(thres))
+    if cache.Hit(key,".npz"):
+        with numpy.load(cache.Path(key,".npz")) as lines:
+            return (lines["cats"],lines["offsets"],lines["xy"])
+    lines = generalize.Generalize(*vectio.ReadLines(vect),thres=float(thres),nprocs=nprocs)
+    cache.Store(key,".npz",lambda name: numpy.savez(name,cats=lines[0],offsets=lines[1],xy=lines[2]))
+    return lines
+
+def SplitLines(seg,out):
+    ## Split lines into two-vertex segments (as v.split vertices=2) with a new category each
+    seg = Segments(seg.x0,seg.y0,seg.x1,seg.y1,numpy.arange(1,len(seg)+1),seg.fid,seg.length,seg.azimuth)
+    vectio.WriteSegments(out,seg)
+    grass.run_command("v.db.addtable",map=out,quiet=True)
+    return seg
 
 def main():
     osm = options["osm"]
     ref =  options["ref"]
     bf = options["buffer"]
-    angle_thres = options["angle_thres"]
+    angle_thres = float(options["angle_thres"])
     doug = options["douglas_thres"]
     out = options["output"]
     out_file =  options["out_file"]
+    tile_size = options["tile_size"]
+    nprocs = int(options["nprocs"])
+    ws = Workspace(options["workspace"])
+    cache = Cache(options["cache"],options["cache_size"])
+
+    prof = timing.Profiler("v.osm.preproc",options["profile"])
+    prof.Install(grass)
 
     ## Check if input files exist
     if not grass.find_file(name=osm,element='vector')['file']:
@@ -112,120 +190,200 @@ def main():
     if not grass.find_file(name=ref,element='vector')['file']:
         grass.fatal(_("Vector map <%s> not found") % ref)
 
+    if flags["o"] and not doug:
+        grass.fatal(_("Generalizing the OSM dataset (-o flag) requires <douglas_thres>"))
+
+    if tile_size and not flags["i"]:
+        grass.fatal(_("Tiled processing requires the in-process engine (-i flag)"))
+
+    ## Load the checkpoint of an interrupted run
+    ckpt = Checkpoint(options["checkpoint"])
+    params = [osm,ref,bf,angle_thres,doug,tile_size,flags["i"],flags["o"]]
+    state = None
+    if flags["r"]:
+        if not ckpt.enabled:
+            grass.fatal(_("Resuming a run requires the <checkpoint> option"))
+        state = ckpt.Load()
+        if state is None:
+            grass.warning(_("No checkpoint found in <%s>: starting from the beginning") % options["checkpoint"])
+        elif state["params"] != params:
+            grass.fatal(_("The checkpoint <%s> was saved with different parameters") % options["checkpoint"])
+
     ## Prepare temporary map names
-    processid = str(time.time()).replace(".","_")
-    ref_gen = "ref_gen_" + processid
+    if state is None:
+        processid = str(time.time()).replace(".","_")
+    else:
+        processid = state["processid"]
+    osm_gen = "osm_gen_" + processid
     ref_split = "ref_split_" + processid
     osm_split = "osm_split_" + processid
-    deg_points = "deg_points_" + processid
-    degmin_points = "degmin_points_" + processid
-    ref_degmin = "ref_degmin_" + processid
     patch = "patch_" + processid
     fdata = "fdata_" + processid
     fbuffer = "fbuffer_" + processid
     odata = "odata_" + processid
-    osdata = "osdata_" + processid
     outbuff = "outbuff_" + processid
 
-    ## Calculate length original data
-    l_osm = length(osm)
-    l_ref = length(ref)
-
-    if l_ref == 0:
-        grass.run_command("g.remove", type="vect", pattern="%s"%processid,flags="fr",quiet=True)
-        grass.fatal(_("No reference data for comparison"))
-
-    if l_osm == 0:
-        grass.run_command("g.remove", type="vect", pattern="%s"%processid,flags="fr",quiet=True)
-        grass.fatal(_("No OSM data for comparison"))
-
-
-    ## Generalize
-    if doug:
-        grass.run_command("v.generalize",input=ref,output=ref_gen,method="douglas", threshold=doug,quiet=True)
-        ref = ref_gen
-
-    ## Split REF datasets
-    grass.run_command("v.split",input=ref,output=ref_split,vertices=2,quiet=True)   
-    grass.run_command("v.out.ogr",input=ref_split,output="/tmp/%s"%ref_split,flags="s",quiet=True)
-    grass.run_command("g.remove",type="vect",name=ref_split,flags="f",quiet=True)
-    grass.run_command("v.in.ogr",input="/tmp/%s/%s.shp"%(ref_split,ref_split),output=ref_split,quiet=True)
-    ref = ref_split
-    shutil.rmtree('/tmp/%s/'%ref_split)
-
-    ## Split OSM datasets
-    grass.run_command("v.split",input=osm,output=osm_split,vertices=2,quiet=True)
-    grass.run_command("v.out.ogr",input=osm_split,output="/tmp/%s"%osm_split,flags="s",quiet=True)
-    grass.run_command("g.remove",type="vect",name=osm_split,flags="f",quiet=True)
-    grass.run_command("v.in.ogr",input="/tmp/%s/%s.shp"%(osm_split,osm_split),output=osm_split,quiet=True)
-    osm_orig = osm
-    osm = osm_split
-    shutil.rmtree('/tmp/%s/'%osm_split)
-
-    # Calculate degree and extract REF category lines intersecting points with minimum value
-    grass.run_command("v.net.centrality",input=ref, output=deg_points, degree="degree",flags="a",quiet=True)
-    list_values = (grass.read_command("v.db.select",map=deg_points,columns="degree",flags="c",quiet=True)).split("\n")[0:-1]
-    degmin = min(map(float,list_values))
- 
-    grass.run_command("v.extract", input=deg_points, output=degmin_points, where="degree=%s"%degmin,quiet=True)
-    grass.run_command("v.select",ainput=ref,binput=degmin_points,output=ref_degmin,operator="overlap",quiet=True)
-    list_lines = (grass.read_command("v.db.select",map=ref_degmin,columns="cat",flags="c",quiet=True)).split("\n")[0:-1]
-    #print list_lines
+    if state is None:
+        ## Calculate length original data
+        prof.Stage("length")
+        l_osm = ws.Length(osm)
+        l_ref = ws.Length(ref)
+
+        if l_ref == 0:
+            grass.run_command("g.remove", type="vect", pattern="%s"%processid,flags="fr",quiet=True)
+            grass.fatal(_("No reference data for comparison"))
+
+        if l_osm == 0:
+            grass.run_command("g.remove", type="vect", pattern="%s"%processid,flags="fr",quiet=True)
+            grass.fatal(_("No OSM data for comparison"))
+
+
+        ## Generalize, one network after the other: each gets all the nprocs processes
+        if doug:
+            prof.Stage("generalize")
+            ref_lines = Generalize(ref,doug,cache,nprocs)
+            if flags["o"]:
+                osm_lines = Generalize(osm,doug,cache,nprocs)
+
+        ## Split REF, split OSM: the two chains are independent
+        prof.Stage("split")
+        graph = tasks.TaskGraph(nprocs)
+        if doug:
+            graph.Add("ref_seg",lambda: SplitLines(Segments.FromLines(*ref_lines),ref_split))
+        else:
+            graph.Add("ref_seg",lambda: SplitLines(ws.Segments(ref),ref_split))
+        if flags["o"]:
+            ## The output is cut from the generalized OSM lines, which the pieces lie on
+            def SplitOSM():
+                vectio.WriteLines(osm_gen,*osm_lines)
+                return SplitLines(Segments.FromLines(*osm_lines),osm_split)
+            graph.Add("osm_seg",SplitOSM)
+        else:
+            graph.Add("osm_seg",lambda: SplitLines(ws.Segments(osm),osm_split))
+        res = graph.Run()
+        ref_seg = res["ref_seg"]
+        osm_seg = res["osm_seg"]
+        ref = ref_split
+        osm_orig = osm_gen if flags["o"] else osm
+        osm = osm_split
+        prof.Count(len(ref_seg)+len(osm_seg))
+
+        prof.Stage("degree")
+        # Calculate node degree and get REF category lines ending at nodes with minimum value
+        list_lines = [str(c) for c in topology.MinDegreeCats(ref_seg)]
+
+        ## First checkpoint: the split segments and everything the comparison needs
+        state = {"params":params,"processid":processid,"l_osm":l_osm,"l_ref":l_ref,"lines":list_lines,"done":0}
+        arrays = ref_seg.Arrays("ref_")
+        arrays.update(osm_seg.Arrays("osm_"))
+        ckpt.Save(state,"segments",**arrays)
+    else:
+        ## Resume: the split maps of the interrupted run are still there
+        prof.Stage("resume")
+        grass.message(_("Resuming from the checkpoint <%s>") % options["checkpoint"])
+        l_osm = state["l_osm"]
+        l_ref = state["l_ref"]
+        arrays = ckpt.LoadArrays("segments")
+        ref_seg = Segments.FromArrays(arrays,"ref_")
+        osm_seg = Segments.FromArrays(arrays,"osm_")
+        ref = ref_split
+        osm_orig = osm_gen if flags["o"] else osm
+        osm = osm_split
+        list_lines = state["lines"]
   
-    ## Create new vector map
-    grass.run_command("v.edit",map=patch+"_0_0",tool="create",quiet=True)
-    
-    list_feature = grass.read_command("v.db.select",map=ref,columns="cat",flags="c",quiet=True).split("\n")[0:-1]
-    i=0
-    z=0
+    ## Azimuth of all the split segments at once
+    az_ref = ref_seg.Azimuth()
+    az_osm = osm_seg.Azimuth()
+
+    prof.Stage("angle comparison",len(ref_seg))
+    flat = numpy.isin(ref_seg.cat, [int(c) for c in list_lines])
+    if flags["i"]:
+        ## Angular coefficient comparison with the in-process engine
+        if tile_size:
+            ## Stream tiles, keeping only the pieces found so far (by OSM category, to be checkpointed)
+            pieces = ([],[],[])
+            if state["done"]>0:
+                saved = ckpt.LoadArrays("pieces")
+                for (l,key) in zip(pieces,("cat","t0","t1")):
+                    l.append(saved[key])
+            for (tile,idx,t0,t1) in engine.MatchTiled(ref_seg,osm_seg,float(bf),angle_thres,float(tile_size),flat,state["done"],nprocs):
+                (idx,t0,t1) = engine.MergeIntervals(idx,t0,t1)
+                for (l,a) in zip(pieces,(osm_seg.cat[idx],t0,t1)):
+                    l.append(a)
+                if ckpt.Due():
+                    (cat,t0,t1) = [numpy.concatenate(l) for l in pieces]
+                    pieces = ([cat],[t0],[t1])
+                    state["done"] = tile+1
+                    ckpt.Save(state,"pieces",cat=cat,t0=t0,t1=t1)
+            (cat,t0,t1) = [numpy.concatenate(l) for l in pieces]
+            idx = osm_seg.Find(cat)
+        else:
+            (idx,t0,t1) = engine.MatchSegments(ref_seg,osm_seg,float(bf),angle_thres,flat)
+        list_feature = []
+    else:
+        ## Candidate pairs of REF and OSM segment categories (continued from the checkpoint)
+        pairs = ([numpy.zeros(0,dtype=int)],[numpy.zeros(0,dtype=int)])
+        if state["done"]>0:
+            saved = ckpt.LoadArrays("pairs")
+            pairs[0].append(saved["ref"])
+            pairs[1].append(saved["osm"])
+        list_feature = grass.read_command("v.db.select",map=ref,columns="cat",flags="c",quiet=True).split("\n")[0:-1]
+    done = state["done"]
     #print list_feature
 
     ## Angular coefficient Comparison
-    for f in list_feature:
+    set_lines = set(list_lines)
+    for f in list_feature[done:]:
         grass.run_command("v.extract",input=ref,output=fdata+"_%s"%f,where="cat=%s"%f,overwrite=True,quiet=True) 
-        if f in list_lines:
+        if f in set_lines:
             grass.run_command("v.buffer",input=fdata+"_%s"%f,output=fbuffer+"_%s"%f,flags="c",distance=bf,overwrite=True,quiet=True)
         else:
             grass.run_command("v.buffer",input=fdata+"_%s"%f,output=fbuffer+"_%s"%f,distance=bf,overwrite=True,quiet=True)
 
         grass.run_command("v.overlay",ainput=osm, atype="line",binput=fbuffer+"_%s"%f,output=odata+"_%s"%f,operator="and",overwrite=True,quiet=True)
         lines = ((grass.read_command("v.info", map=odata+"_%s"%f,flags="t",quiet=True)).split("\n")[2]).split("=")[1]
-        if int(lines)==0:
-            grass.run_command("g.remove", type="vect", name="%s_%s,%s_%s,%s_%s"%(fdata,f,fbuffer,f,odata,f),flags="f",quiet=True)
-        else:
-            ## Get REF angular coefficient
-            list_subfeature = grass.read_command("v.db.select",map=odata+"_%s"%f,columns="cat",flags="c",quiet=True).split("\n")[0:-1]
-            m_ref = GetCoeff(fdata+"_%s"%f)
-            #print m_ref
-
-            ## Get OSM subfeatures angular coefficient
-            for sf in list_subfeature:    
-                grass.run_command("v.extract",input=odata+"_%s"%f,output=osdata+"_%s_%s"%(f,sf),where="cat=%s"%sf,overwrite=True,quiet=True) 
-                m_osm = GetCoeff(osdata+"_%s_%s"%(f,sf))
-    
-                     
-                if math.degrees(abs(math.atan((m_ref-m_osm)/(1+m_ref*m_osm))))<=angle_thres:
-                    grass.run_command("v.patch",input="%s_%s_%s,%s_%s_%s"%(patch,i,z,osdata,f,sf),output=patch+"_%s_%s"%(f,sf),overwrite=True,quiet=True)
-                    grass.run_command("g.remove", type="vect", name="%s_%s_%s,%s_%s_%s"%(patch,i,z,osdata,f,sf), flags="f",quiet=True)
-                    i=f
-                    z=sf
-                else:
-                    grass.run_command("g.remove", type="vect", name=osdata+"_%s_%s"%(f,sf), flags="f",quiet=True)
-            grass.run_command("g.remove", type="vect", name="%s_%s,%s_%s,%s_%s"%(fdata,f,fbuffer,f,odata,f), flags="f",quiet=True)
+        if int(lines)>0:
+            ## Collect the OSM subfeatures: the angles are compared for all the pairs after the loop
+            list_subfeature = grass.read_command("v.db.select",map=odata+"_%s"%f,columns="cat,a_cat",flags="c",quiet=True).split("\n")[0:-1]
+            sub = numpy.array([item.split("|") for item in list_subfeature],dtype=int).reshape(-1,2)
+            pairs[0].append(numpy.repeat(int(f),sub.shape[0]))
+            pairs[1].append(sub[:,1])
+        grass.run_command("g.remove", type="vect", name="%s_%s,%s_%s,%s_%s"%(fdata,f,fbuffer,f,odata,f),flags="f",quiet=True)
+
+        ## Save the loop position and the candidate pairs
+        done += 1
+        if ckpt.Due():
+            (p_ref,p_osm) = [numpy.concatenate(l) for l in pairs]
+            pairs = ([p_ref],[p_osm])
+            state["done"] = done
+            ckpt.Save(state,"pairs",ref=p_ref,osm=p_osm)
+
+    if not flags["i"]:
+        ## Materialize the accepted pieces at once: the part of every OSM segment inside the buffer of its REF segment
+        ## Angular coefficient comparison of all the pairs in one vector operation
+        (p_ref,p_osm) = [numpy.concatenate(l) for l in pairs]
+        (ri,oi) = (ref_seg.Find(p_ref),osm_seg.Find(p_osm))
+        keep = AngleDiff(az_ref[ri],az_osm[oi]) <= angle_thres
+        (idx,t0,t1) = engine.ClipPairs(ref_seg,osm_seg,ri[keep],oi[keep],float(bf),flat)
+
+    ## Merge pieces found more than once (in the buffers of two REF segments, or in the overlap zone of two tiles)
+    (idx,t0,t1) = engine.MergeIntervals(idx,t0,t1)
+    vectio.WriteSegments(patch,osm_seg.Pieces(idx,t0,t1))
 
     ## Clean output map
-    l_map = grass.read_command("g.list",type="vect",quiet=True).split("\n")[0:-1]
-    last_map = [s for s in l_map if "patch" in s]
-    grass.run_command("v.buffer", input=last_map[0],output=outbuff, distance=0.0001,quiet=True)
+    prof.Stage("cleanup")
+    grass.run_command("v.buffer", input=patch,output=outbuff, distance=0.0001,quiet=True)
     grass.run_command("v.overlay",ainput=osm_orig,atype="line",binput=outbuff,output=out,operator="and",flags="t",quiet=True)
 
     ## Delete all maps
-    grass.run_command("g.remove",type="vect",name="%s,%s,%s,%s,%s,%s,%s"%(deg_points,ref_degmin,degmin_points,ref_gen,ref_split,osm_split,outbuff),flags="f",quiet=True)
+    grass.run_command("g.remove",type="vect",name="%s,%s,%s,%s"%(osm_gen,ref_split,osm_split,outbuff),flags="f",quiet=True)
 
-    grass.run_command("g.remove",type="vect",name="%s"%last_map[0],flags="f",quiet=True)
+    grass.run_command("g.remove",type="vect",name="%s"%patch,flags="f",quiet=True)
+    ckpt.Remove()
 
     ## Calculate final map statistics
-    l_osm_proc = length(out)
+    prof.Stage("statistics")
+    l_osm_proc = ws.Length(out)
     diff_osm = l_osm - l_osm_proc
     diff_p_osm = diff_osm/l_osm*100
     diff_new = l_ref - l_osm_proc
@@ -248,7 +406,10 @@ def main():
     print("Difference between OSM original and processed datasets length: %s m (%s%%)\n"%(round(diff_osm,1),round(diff_p_osm,1)))
     print("Difference between REF dataset and processed OSM dataset length: %s m (%s%%)\n"%(round(diff_new,1),round(diff_p_new,1)))
     print("#####################################################################\n")
-    
+
+    cache.Evict()
+    ws.Save()
+    prof.Write()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+#  -*- coding:utf-8 -*-
+##############################################################################
+# MODULE:    v.osm.server
+# AUTHOR(S): Monia Molinari, Marco Minghini
+# PURPOSE:   Server answering comparison requests on OSM and reference datasets kept in memory
+# COPYRIGHT: (C) 2015 by the GRASS Development Team
+#
+# This program is free software under the GNU General Public
+# License (>=v2). Read the file COPYING that comes with GRASS
+# for details.
+# ############################################################################
+#%Module
+#%  description: Server answering comparison requests on OSM and reference datasets kept in memory
+#%  keywords: vector, OSM, comparison, server
+#%End
+
+#%option
+#% key: osm
+#% type: string
+#% gisprompt: old,vector,vector
+#% description: OpenStreetMap dataset to be loaded at startup
+#% required: no
+#%end
+
+#%option
+#% key: ref
+#% type: string
+#% gisprompt: old,vector,input
+#% description: Reference dataset to be loaded at startup
+#% required: no
+#%end
+
+#%option
+#% key: host
+#% type: string
+#% description: Address the server listens on
+#% required: no
+#% answer: 127.0.0.1
+#%end
+
+#%option
+#% key: port
+#% type: integer
+#% description: Port the server listens on
+#% required: no
+#% answer: 8090
+#%end
+
+#%option
+#% key: maxdist
+#% type: double
+#% description: Largest buffer or tolerance value that can be requested (map units)
+#% required: no
+#% answer: 100
+#%end
+
+#%option
+#% key: step
+#% type: double
+#% description: Maximum length of the line pieces whose distances are computed (map units)
+#% required: no
+#% answer: 1
+#%end
+
+#%option
+#% key: cache_size
+#% type: double
+#% description: Memory for networks and distances kept between requests (MB)
+#% required: no
+#% answer: 1024
+#%end
+
+#%option
+#% key: queue_size
+#% type: integer
+#% description: Maximum number of requests waiting to be processed
+#% required: no
+#% answer: 100
+#%end
+
+#%option
+#% key: timeout
+#% type: double
+#% description: Time after which a waiting request is answered with an error (seconds)
+#% required: no
+#% answer: 600
+#%end
+
+import os
+import sys
+import grass.script as grass
+from grass.script.utils import get_lib_path
+
+## Shared library (installed in $GISBASE/etc/v.osm, or next to the module folders)
+sys.path[:0] = [p for p in (get_lib_path(modname="v.osm"), os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")) if p]
+import osmcomp
+osmcomp.Require(grass)
+
+from osmcomp import server, vectio
+
+
+def Stamp(vect):
+    if not grass.find_file(name=vect,element='vector')['file']:
+        raise ValueError("Vector map <%s> not found" % vect)
+    return vectio.MapStamp(vect)
+
+def Load(vect):
+    ## Keep only the segments: the server cache decides what stays in memory
+    seg = vectio.ReadSegments(vect)
+    vectio.Forget(vect)
+    return seg
+
+def main():
+    osm = options["osm"]
+    ref = options["ref"]
+    host = options["host"]
+    port = int(options["port"])
+    maxdist = float(options["maxdist"])
+    step = float(options["step"])
+    cache_size = float(options["cache_size"])
+
+    if grass.locn_is_latlong():
+        grass.fatal(_("The server requires a projected location"))
+
+    comparison = server.Comparison(Stamp,Load,step,maxdist,cache_size*2**20)
+
+    ## Load the datasets and their distances now, so that the first requests are fast
+    if len(osm)>0 and len(ref)>0:
+        grass.message(_("Loading <%s> and <%s>...") % (osm,ref))
+        comparison.Pieces(osm,ref)
+        comparison.Pieces(ref,osm)
+
+    grass.message(_("Listening on http://%s:%s/") % (host,port))
+    try:
+        server.Serve(comparison,host,port,int(options["queue_size"]),float(options["timeout"]),grass.verbose)
+    except KeyboardInterrupt:
+        grass.message(_("Server stopped"))
+
+
+if __name__ == "__main__":
+    options,flags = grass.parser()
+    sys.exit(main())